@@ -6,6 +6,10 @@ SAT题型识别工具
 """
 
 import argparse
+import asyncio
+import fnmatch
+import hashlib
+import io
 import json
 import re
 import sys
@@ -13,13 +17,25 @@ import os
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 import threading
-import concurrent.futures
-from queue import Queue
+import time
+from queue import Empty, Queue, SimpleQueue
 
 import openai
 
+try:
+    # 异步批量分析直接用aiohttp请求chat/completions接口，未安装时使用AsyncOpenAI
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    # orjson的序列化比标准库json快数倍，未安装时回退到json
+    import orjson
+except ImportError:
+    orjson = None
+
 # SAT题型定义 - 新分类
 QUESTION_TYPES = {
     # 特殊分类
@@ -139,12 +155,278 @@ QUESTION_TYPES = {
     }
 }
 
+# 规则分析用的预处理结构（导入时构建一次），所有题型共用，每个文本只查一遍
+
+# 只由文字和“.*”组成的正则，如 r"area"、r"solve.*equation"
+_LITERAL_PATTERN_RE = re.compile(r"[\w' ]+(?:\.\*[\w' ]+)*")
+
+
+def _build_keyword_table() -> Dict[str, List[str]]:
+    """关键词 -> 包含该关键词的题型"""
+    table = {}
+    for qtype, config in QUESTION_TYPES.items():
+        for keyword in config["keywords"]:
+            table.setdefault(keyword.lower(), []).append(qtype)
+    return table
+
+
+def _build_pattern_table() -> List[Tuple[Tuple[str, ...], Optional[re.Pattern], List[str]]]:
+    """
+    正则 -> 包含该正则的题型，返回[(必须出现的文字, 正则, 题型列表)]
+    纯文本正则只做子串查找；“a.*b”形式先用子串查找确认各段文字都出现，再运行正则
+    """
+    pattern_types = {}
+    for qtype, config in QUESTION_TYPES.items():
+        for pattern in config["patterns"]:
+            pattern_types.setdefault(pattern, []).append(qtype)
+    
+    table = []
+    for pattern, qtypes in pattern_types.items():
+        if _LITERAL_PATTERN_RE.fullmatch(pattern):
+            needles = tuple(part.lower() for part in pattern.split(".*"))
+            regex = re.compile(pattern, re.IGNORECASE) if len(needles) > 1 else None
+        else:
+            needles, regex = (), re.compile(pattern, re.IGNORECASE)
+        table.append((needles, regex, qtypes))
+    return table
+
+
+# 关键词和纯文本正则用C实现的子串查找，比正则快得多；
+# 关键词按子串匹配（"percent"也匹配"percentages"），每个关键词只查一次
+_KEYWORD_TYPES = _build_keyword_table()
+_PATTERN_TABLE = _build_pattern_table()
+
+# 规则分析只扫描文本的前N个字符（SAT题干远小于此长度，之后多为文章内容）
+_ANALYZE_TEXT_LIMIT = 4096
+
+# 短于此长度的文本不可能是题目（页码、扫描水印等），跳过规则匹配
+_MIN_QUESTION_LENGTH = 20
+
+# 整段只有一行版权/页脚/页码的文本
+_BOILERPLATE_RE = re.compile(r"\s*(?:©|copyright|college board|page \d+)[^\n]*", re.IGNORECASE)
+
+# 解析题目文件时跳过的指令性内容和标题：多题目对象格式按键名/内容，数组格式按id/内容
+_SKIP_QUESTION_KEYS = frozenset({"Instructions", "partial_top", "title", "header", "Header/Directions", "Footer", "IMPORTANT REMINDERS"})
+_SKIP_QUESTION_CONTENT_RE = re.compile(r"instruction|copyright|college board|pencil required|test security|violation", re.IGNORECASE)
+_SKIP_LIST_IDS = frozenset({"Instructions", "title", "header", "Header/Directions", "Footer", "IMPORTANT REMINDERS"})
+_SKIP_LIST_CONTENT_RE = re.compile(r"instruction|copyright|college board", re.IGNORECASE)
+
+# 特殊规则中需要数字/运算符/图表特征的题型（math-前缀）是否存在
+_HAS_MATH_RULES = any(qtype.startswith("math-") for qtype in QUESTION_TYPES)
+_DIGIT_RE = re.compile(r'\d')
+_OP_RE = re.compile(r'[+\-*/=]')
+
+# AI分析使用的模型（GPT-4o-mini，更稳定且便宜）
+_AI_MODEL = "openai/gpt-4o-mini"
+
+# 考试说明/非题目内容的关键词
+_TITLE_KEYWORDS = (
+    "important reminders", "pencil required", "test security",
+    "no.2 pencil", "mechanical pencil", "violation", "sat", "digital"
+)
+
+# Batch API使用的模型（OpenAI官方模型名称，不带openrouter前缀）
+_BATCH_MODEL = "gpt-4o-mini"
+
+# 异步批量分析时的默认并发请求数
+_ASYNC_CONCURRENCY = 20
+
+# 批量分析时每完成多少个文件输出一次缓冲的进度
+_PROGRESS_FLUSH_EVERY = 10
+
+# 异步分析直接POST的OpenRouter接口
+_CHAT_COMPLETIONS_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# 直接POST时需要退避重试的HTTP状态码（与openai SDK的重试范围一致）
+_RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# AI请求遇到速率限制/超时时的重试次数和退避因子
+_AI_MAX_RETRIES = 3
+_AI_BACKOFF_FACTOR = 2.0
+
+# 题型判断标准和题型代码列表（单题和批量提示词共用）
+_TYPE_GUIDE = """
+**重要判断标准：**
+
+**数学题型判断：**
+- algebra: 纯数学计算，解方程、函数计算、代数运算（如：3x+4=10, f(x)=2x²-5x, 求f(8)）
+- word_problems: 有现实场景描述，需要建立数学模型的文字题（如：学生卖贴纸赚钱，需要卖多少个）
+- advanced_math: 二次方程、多项式、复杂函数（如：f(x)=(x-a)(x-b), 二次函数顶点）
+- geometry: 几何图形、面积体积计算（如：三角形面积、圆的周长）
+- trigonometry: 三角函数、直角三角形（如：sin, cos, tan, SOH-CAH-TOA）
+- coordinate_plane: 坐标平面、直线斜率、截距（如：y=mx+b, 直线截距）
+- statistics: 统计量、概率（如：平均数、中位数、概率计算）
+- data_analysis: 图表数据分析（如：表格、图表解读）
+- percents_and_ratios: 百分比、比例计算（如：30% of 200, 比例关系）
+- powers_and_roots: 指数、根号运算（如：√x, x², 指数运算）
+
+**阅读写作题型判断：**
+- words_in_context: 词汇填空、词义解释（如：Which choice completes the text...）
+- boundaries: 语法标点、句子结构（如：comma splice, run-on sentence）
+- transitions: 过渡词选择（如：however, therefore, moreover）
+- central_ideas_and_details: 主旨大意、支持细节（如：main idea, supporting details）
+- command_of_evidence_textual: 找文本证据（如：which evidence best supports...）
+- command_of_evidence_quantitative: 数据图表证据（如：table shows, graph indicates）
+- inference: 逻辑推断（如：can be inferred, suggests, implies）
+- form_structure_and_sense: 文章结构、逻辑顺序（如：logical order, sentence order）
+- text_structure_and_purpose: 文章目的结构（如：author's purpose, structure serves）
+- cross_text_connections: 多文本比较（如：both passages, two texts）
+- rhetorical_synthesis: 信息整合论证（如：synthesis, combine information）
+
+**题型代码：**
+- text_structure_and_purpose, cross_text_connections, words_in_context, central_ideas_and_details, command_of_evidence_quantitative, command_of_evidence_textual, inference, boundaries, form_structure_and_sense, transitions, rhetorical_synthesis, algebra, percents_and_ratios, advanced_math, powers_and_roots, word_problems, statistics, data_analysis, coordinate_plane, geometry, trigonometry
+"""
+
+# AI题型识别提示词（固定前缀，题目内容直接拼接在末尾）
+_PROMPT_PREFIX = (
+    "\n分析这个SAT题目，选择最合适的题型。只返回题型代码，不要其他内容。\n"
+    + _TYPE_GUIDE
+    + "\n题目内容：\n"
+)
+
+# 批量题型识别提示词：一次请求分析一个文件中的所有题目
+_BATCH_PROMPT_PREFIX = (
+    "\n分析下面每一道SAT题目，分别选择最合适的题型。每道题返回一行，格式为“序号. 题型代码”，不要其他内容。\n"
+    + _TYPE_GUIDE
+    + "\n题目列表：\n"
+)
+
+
+def _prompt_messages(prefix: str, content: str) -> List[Dict[str, str]]:
+    """固定的提示词放在system消息中、题目放在user消息中，使每次请求的前缀完全相同，便于服务端前缀缓存"""
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "user", "content": content}
+    ]
+
+# 批量结果的每一行：“序号. 题型代码”
+_BATCH_LINE_RE = re.compile(r'^\s*(\d+)\.\s*([a-z_]+)', re.MULTILINE)
+
+# 文件名中的数字（用于自然排序）
+_NUM_RE = re.compile(r'\d+')
+
+
+
+def _iter_txt(root: str, pattern: str = "*.txt") -> Iterator[Tuple[Path, bool]]:
+    """
+    用os.scandir递归遍历目录，先按名称过滤再判断类型（使用目录项缓存的类型信息，不额外stat）
+    题目文件以.txt结尾，排除.type.txt结果文件和系统文件(._开头)
+    
+    Yields:
+        (题目文件路径, 是否存在对应的.type.txt文件)
+    """
+    try:
+        # 一次读完目录项，之后的过滤都在列表推导中完成
+        with os.scandir(root) as it:
+            entries = [entry for entry in it if not entry.name.startswith('._')]
+    except OSError:
+        # 与os.walk一致，无法读取的目录直接跳过
+        return
+    
+    subdirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+    type_names = {entry.name for entry in entries if entry.name.endswith('.type.txt')}
+    files = [entry for entry in entries
+             if entry.name.endswith('.txt') and not entry.name.endswith('.type.txt')
+             and not entry.is_dir(follow_symlinks=False) and fnmatch.fnmatchcase(entry.name, pattern)]
+    
+    for entry in files:
+        yield Path(entry.path), entry.name[:-4] + '.type.txt' in type_names
+    for subdir in subdirs:
+        yield from _iter_txt(subdir, pattern)
+
+
+def _scan_txt_files(directory: Path, pattern: str = "*.txt") -> Dict[Path, bool]:
+    """
+    扫描目录下的题目文本文件
+    
+    Args:
+        directory: 目录路径
+        pattern: 文件匹配模式
+        
+    Returns:
+        {题目文件路径: 是否存在对应的.type.txt文件}
+    """
+    return dict(_iter_txt(os.fspath(directory), pattern))
+
+
+def _type_file_path(file_path) -> str:
+    """题目文件对应的.type.txt路径，用字符串操作代替Path.with_suffix"""
+    return os.path.splitext(os.fspath(file_path))[0] + '.type.txt'
+
+
+def _flush_progress(buf: io.StringIO):
+    """把缓冲的进度输出一次性写到stdout并清空缓冲"""
+    sys.stdout.write(buf.getvalue())
+    sys.stdout.flush()
+    buf.seek(0)
+    buf.truncate()
+
+
+def _cached_type_map(paths: List[Path]) -> Dict[Path, bool]:
+    """
+    批量判断文件是否有对应的.type.txt：每个所在目录只scandir一次，之后都是内存中的集合查找
+    
+    Returns:
+        {文件路径: 是否存在对应的.type.txt文件}
+    """
+    type_names_by_dir = {}
+    cached_map = {}
+    for file_path in paths:
+        parent = os.path.dirname(os.fspath(file_path)) or '.'
+        type_names = type_names_by_dir.get(parent)
+        if type_names is None:
+            try:
+                with os.scandir(parent) as it:
+                    type_names = {entry.name for entry in it if entry.name.endswith('.type.txt')}
+            except OSError:
+                type_names = set()
+            type_names_by_dir[parent] = type_names
+        cached_map[file_path] = os.path.basename(_type_file_path(file_path)) in type_names
+    return cached_map
+
+
+def _dumps_options(options: Dict[str, Any]) -> str:
+    """选项序列化为存入数据库的JSON字符串（保留非ASCII字符）"""
+    if orjson is not None:
+        return orjson.dumps(options).decode("utf-8")
+    return json.dumps(options, ensure_ascii=False)
+
+
+def _is_retryable_error(e: Exception) -> bool:
+    """是否是速率限制、超时或服务端临时错误，需要退避重试"""
+    if isinstance(e, (openai.RateLimitError, openai.APITimeoutError, asyncio.TimeoutError)):
+        return True
+    return (aiohttp is not None and isinstance(e, aiohttp.ClientResponseError)
+            and e.status in _RETRY_STATUSES)
+
+
+def _content_hash(text: str) -> str:
+    """题目文本的内容哈希，作为分类缓存的键"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _is_title_text(text: str) -> bool:
+    """是否是考试说明或非题目内容"""
+    text_lower = text.lower()
+    return any(keyword in text_lower for keyword in _TITLE_KEYWORDS)
+
+
+def _natural_sort_key(file_path: Path, _search=_NUM_RE.search) -> Tuple[int, int, str]:
+    """自然排序键：按文件名（不含扩展名）中的第一个数字排序，没有数字的按名称排在最后"""
+    stem = file_path.stem
+    match = _search(stem)
+    if match:
+        return (0, int(match.group()), stem)
+    return (1, 0, stem)
+
 
 class QuestionTypeAnalyzer:
     """题型分析器"""
     
     def __init__(self, api_key: Optional[str] = None):
         self.question_types = QUESTION_TYPES
+        # 报告中使用的题型说明
+        self._descriptions = {qtype: config.get("description", "未知题型") for qtype, config in self.question_types.items()}
         
         # 初始化AI客户端
         self.api_key = api_key or os.getenv('OPENAI_API_KEY') or os.getenv('OPENROUTER_API_KEY')
@@ -154,25 +436,52 @@ class QuestionTypeAnalyzer:
                 api_key=self.api_key,
                 base_url="https://openrouter.ai/api/v1"  # 使用OpenRouter
             )
+            # 异步客户端，只在未安装aiohttp时用于并发批量分析
+            if aiohttp is None:
+                self.aclient = openai.AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url="https://openrouter.ai/api/v1"
+                )
+            else:
+                self.aclient = None
         else:
             self.client = None
+            self.aclient = None
         
         # 数据库路径
         self.db_path = Path("/Volumes/ext/SatExams/data/types.db")
         self.db_path.parent.mkdir(exist_ok=True)
         
-        # 线程锁
+        # 线程锁（保护唯一的写连接）
         self.db_lock = threading.Lock()
         
+        # 异步分析直接POST使用的aiohttp会话，首次请求时在事件循环中创建
+        self._session = None
+        
+        # 每个线程一个只读连接，写操作共用一个持久连接
+        self._tls = threading.local()
+        self._writer = None
+        
         # 初始化数据库
         self._init_database()
     
     def _init_database(self):
         """初始化数据库 - 支持新的JSON格式"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            # 写连接使用自动提交模式，批量写入时显式BEGIN/COMMIT
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
             cursor = conn.cursor()
             
+            # WAL模式：读连接不会被写入阻塞；NORMAL同步合并fsync，加大页缓存和内存映射
+            cursor.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA cache_size=-262144;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA foreign_keys=ON;
+            """)
+            
             # 创建新的题目表结构
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS questions (
@@ -198,13 +507,78 @@ class QuestionTypeAnalyzer:
                     add_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
-            conn.commit()
-            conn.close()
+
+            # AI分类结果缓存，重复出现的题目不再请求AI
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS classify_cache (
+                    hash TEXT PRIMARY KEY,
+                    qtype TEXT NOT NULL,
+                    confidence REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # 统计报告使用的索引（GROUP BY question_type / ORDER BY add_time DESC）
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_type ON questions(question_type)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_add_time ON questions(add_time DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_types_type ON question_types(question_type)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_types_add_time ON question_types(add_time DESC)")
+            # 按文件查询和upsert都走UNIQUE(file_path, question_id)的自动索引，不需要再单独建file_path索引
+
+            # 还没有统计信息时收集一次，之后由close()中的PRAGMA optimize按需更新
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None or cursor.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone() is None:
+                cursor.execute("ANALYZE")
+
+            self._writer = conn
             print(f"数据库初始化成功: {self.db_path}")
         except Exception as e:
             print(f"数据库初始化失败: {e}")
     
+    def _reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接（首次使用时创建，之后复用）"""
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._tls.conn = conn
+        return conn
+    
+    def close(self):
+        """关闭写连接和当前线程的只读连接"""
+        conn = getattr(self._tls, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._tls.conn = None
+        if self._writer is not None:
+            self._writer.execute("PRAGMA optimize")
+            self._writer.close()
+            self._writer = None
+    
+    def _get_cached_classification(self, text: str) -> Optional[Tuple[str, float, Dict[str, float]]]:
+        """按内容哈希查找之前的AI分类结果，未命中返回None"""
+        try:
+            cursor = self._reader().cursor()
+            cursor.execute("SELECT qtype, confidence FROM classify_cache WHERE hash = ?", (_content_hash(text),))
+            row = cursor.fetchone()
+        except Exception as e:
+            print(f"读取分类缓存失败: {e}")
+            return None
+        if row is None:
+            return None
+        qtype, confidence = row
+        return qtype, confidence, {qtype: 10}
+    
+    def _cache_classification(self, text: str, qtype: str, confidence: float):
+        """记录AI分类结果"""
+        with self.db_lock:
+            try:
+                self._writer.execute(
+                    "INSERT OR IGNORE INTO classify_cache (hash, qtype, confidence) VALUES (?, ?, ?)",
+                    (_content_hash(text), qtype, confidence)
+                )
+            except Exception as e:
+                print(f"写入分类缓存失败: {e}")
+    
     def parse_json_content(self, content: str) -> List[Dict[str, Any]]:
         """
         解析JSON格式的题目内容
@@ -213,7 +587,7 @@ class QuestionTypeAnalyzer:
             content: JSON格式的题目内容
             
         Returns:
-            题目列表，每个题目包含id, content, options
+            题目列表，每个题目包含id, content, options，以及序列化后的选项_options_json
         """
         try:
             data = json.loads(content)
@@ -232,50 +606,44 @@ class QuestionTypeAnalyzer:
                 else:
                     # 多题目格式: {"key": {"id": "...", "content": "...", "options": {...}}}
                     for question_id, question_data in data.items():
-                        if isinstance(question_data, dict):
-                            # 跳过指令性内容和标题
-                            skip_keywords = ["Instructions", "partial_top", "title", "header", "Header/Directions", "Footer", "IMPORTANT REMINDERS"]
-                            content = question_data.get("content", "").lower()
-                            if (question_id in skip_keywords or 
-                                "instruction" in content or 
-                                "copyright" in content or 
-                                "college board" in content or
-                                "page" in content and len(content) < 100 or
-                                "pencil required" in content or
-                                "test security" in content or
-                                "violation" in content):
-                                continue
-                            question = {
-                                "id": question_data.get("id", question_id),
-                                "content": question_data.get("content", ""),
-                                "options": question_data.get("options", {})
-                            }
-                            questions.append(question)
-            elif isinstance(data, list):
-                # 数组格式: [{"id": "...", "content": "...", "options": {...}}]
-                for question_data in data:
-                    if isinstance(question_data, dict):
+                        if not isinstance(question_data, dict):
+                            continue
                         # 跳过指令性内容和标题
-                        skip_keywords = ["Instructions", "title", "header", "Header/Directions", "Footer", "IMPORTANT REMINDERS"]
-                        content = question_data.get("content", "").lower()
-                        if (question_data.get("id") in skip_keywords or 
-                            "instruction" in content or 
-                            "copyright" in content or 
-                            "college board" in content or
-                            "page" in content and len(content) < 100):
+                        content = question_data.get("content", "")
+                        if (question_id in _SKIP_QUESTION_KEYS or
+                                _SKIP_QUESTION_CONTENT_RE.search(content) or
+                                len(content) < 100 and "page" in content.lower()):
                             continue
-                        question = {
-                            "id": question_data.get("id", "unknown"),
-                            "content": question_data.get("content", ""),
+                        questions.append({
+                            "id": question_data.get("id", question_id),
+                            "content": content,
                             "options": question_data.get("options", {})
-                        }
-                        questions.append(question)
+                        })
+            elif isinstance(data, list):
+                # 数组格式: [{"id": "...", "content": "...", "options": {...}}]
+                for question_data in data:
+                    if not isinstance(question_data, dict):
+                        continue
+                    # 跳过指令性内容和标题
+                    question_id = question_data.get("id")
+                    content = question_data.get("content", "")
+                    if (question_id in _SKIP_LIST_IDS or
+                            _SKIP_LIST_CONTENT_RE.search(content) or
+                            len(content) < 100 and "page" in content.lower()):
+                        continue
+                    questions.append({
+                        "id": question_data.get("id", "unknown"),
+                        "content": content,
+                        "options": question_data.get("options", {})
+                    })
             
+            for question in questions:
+                question["_options_json"] = _dumps_options(question["options"])
             return questions
         except json.JSONDecodeError as e:
             print(f"JSON解析失败: {e}")
             # 如果不是JSON格式，尝试作为单个题目处理
-            return [{"id": "1", "content": content, "options": {}}]
+            return [{"id": "1", "content": content, "options": {}, "_options_json": "{}"}]
         except Exception as e:
             print(f"解析题目内容失败: {e}")
             return []
@@ -291,46 +659,42 @@ class QuestionTypeAnalyzer:
             confidences: 对应的置信度列表
         """
         with self.db_lock:  # 使用线程锁保护数据库操作
+            cursor = None
             try:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
+                cursor = self._writer.cursor()
+                # 开始时即获取写锁，避免并发写入中途遇到SQLITE_BUSY
+                cursor.execute("BEGIN IMMEDIATE")
                 
-                for i, question in enumerate(questions):
-                    question_id = question["id"]
-                    content = question["content"]
-                    options = json.dumps(question["options"], ensure_ascii=False)
-                    question_type = question_types[i] if i < len(question_types) else "unknown"
-                    confidence = confidences[i] if confidences and i < len(confidences) else 0.8
-                    
-                    # 检查是否已存在
-                    cursor.execute("""
-                        SELECT id FROM questions 
-                        WHERE file_path = ? AND question_id = ?
-                    """, (file_path, question_id))
-                    
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # 更新现有记录
-                        cursor.execute("""
-                            UPDATE questions 
-                            SET question_type = ?, content = ?, options = ?, 
-                                confidence = ?, add_time = CURRENT_TIMESTAMP
-                            WHERE file_path = ? AND question_id = ?
-                        """, (question_type, content, options, confidence, file_path, question_id))
-                        print(f"更新题目: {file_path} - {question_id}")
-                    else:
-                        # 插入新记录
-                        cursor.execute("""
-                            INSERT INTO questions (file_path, question_id, question_type, content, options, confidence)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (file_path, question_id, question_type, content, options, confidence))
-                        print(f"插入题目: {file_path} - {question_id}")
+                rows = [
+                    (
+                        file_path,
+                        question["id"],
+                        question_types[i] if i < len(question_types) else "unknown",
+                        question["content"],
+                        question.get("_options_json") or _dumps_options(question["options"]),
+                        confidences[i] if confidences and i < len(confidences) else 0.8,
+                    )
+                    for i, question in enumerate(questions)
+                ]
                 
-                conn.commit()
-                conn.close()
+                # 已存在的(file_path, question_id)直接更新，一条预编译语句写完整个文件
+                cursor.executemany("""
+                    INSERT INTO questions (file_path, question_id, question_type, content, options, confidence)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(file_path, question_id) DO UPDATE SET
+                        question_type = excluded.question_type,
+                        content = excluded.content,
+                        options = excluded.options,
+                        confidence = excluded.confidence,
+                        add_time = CURRENT_TIMESTAMP
+                """, rows)
+                print(f"保存题目: {file_path} - {len(rows)} 题")
+                
+                cursor.execute("COMMIT")
                 
             except Exception as e:
+                if cursor is not None and self._writer.in_transaction:
+                    cursor.execute("ROLLBACK")
                 print(f"保存到数据库失败: {e}")
     
     def get_questions_from_database(self, file_path: str = None) -> List[Dict]:
@@ -343,43 +707,52 @@ class QuestionTypeAnalyzer:
         Returns:
             题目列表
         """
-        with self.db_lock:  # 使用线程锁保护数据库操作
-            try:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                
-                if file_path:
-                    cursor.execute("""
-                        SELECT id, file_path, question_id, question_type, content, options, confidence, add_time
-                        FROM questions WHERE file_path = ?
-                        ORDER BY question_id
-                    """, (file_path,))
-                else:
-                    cursor.execute("""
-                        SELECT id, file_path, question_id, question_type, content, options, confidence, add_time
-                        FROM questions ORDER BY add_time DESC
-                    """)
-                
-                results = []
-                for row in cursor.fetchall():
-                    options = json.loads(row[5]) if row[5] else {}
-                    results.append({
+        return list(self.iter_questions_from_database(file_path))
+    
+    def iter_questions_from_database(self, file_path: str = None, batch_size: int = 1000) -> Iterator[Dict]:
+        """
+        逐条产出数据库中的题目，每次从SQLite取batch_size行，不把整个结果集读入内存
+        
+        Args:
+            file_path: 可选的文件路径，如果为None则获取所有记录
+            batch_size: 每次fetchmany的行数
+            
+        Yields:
+            题目字典
+        """
+        try:
+            cursor = self._reader().cursor()
+            
+            if file_path:
+                cursor.execute("""
+                    SELECT id, file_path, question_id, question_type, content, options, confidence, add_time
+                    FROM questions WHERE file_path = ?
+                    ORDER BY question_id
+                """, (file_path,))
+            else:
+                cursor.execute("""
+                    SELECT id, file_path, question_id, question_type, content, options, confidence, add_time
+                    FROM questions ORDER BY add_time DESC
+                """)
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {
                         "id": row[0],
                         "file_path": row[1],
                         "question_id": row[2],
                         "question_type": row[3],
                         "content": row[4],
-                        "options": options,
+                        "options": json.loads(row[5]) if row[5] else {},
                         "confidence": row[6],
                         "add_time": row[7]
-                    })
-                
-                conn.close()
-                return results
-                
-            except Exception as e:
-                print(f"从数据库获取数据失败: {e}")
-                return []
+                    }
+            
+        except Exception as e:
+            print(f"从数据库获取数据失败: {e}")
     
     def save_to_database(self, png_path: str, question_type: str, txt_content: str = None):
         """
@@ -390,35 +763,32 @@ class QuestionTypeAnalyzer:
             question_type: 识别的题型
             txt_content: 文本内容
         """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 检查是否已存在
-            cursor.execute("SELECT id FROM question_types WHERE png_path = ?", (png_path,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # 更新现有记录
-                cursor.execute("""
-                    UPDATE question_types 
-                    SET question_type = ?, txt_content = ?, add_time = CURRENT_TIMESTAMP
-                    WHERE png_path = ?
-                """, (question_type, txt_content, png_path))
-                print(f"更新数据库记录: {png_path}")
-            else:
-                # 插入新记录
-                cursor.execute("""
-                    INSERT INTO question_types (png_path, question_type, txt_content)
-                    VALUES (?, ?, ?)
-                """, (png_path, question_type, txt_content))
-                print(f"插入数据库记录: {png_path}")
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            print(f"保存到数据库失败: {e}")
+        with self.db_lock:  # 使用线程锁保护唯一的写连接
+            try:
+                cursor = self._writer.cursor()
+                
+                # 检查是否已存在
+                cursor.execute("SELECT id FROM question_types WHERE png_path = ?", (png_path,))
+                existing = cursor.fetchone()
+                
+                if existing:
+                    # 更新现有记录
+                    cursor.execute("""
+                        UPDATE question_types 
+                        SET question_type = ?, txt_content = ?, add_time = CURRENT_TIMESTAMP
+                        WHERE png_path = ?
+                    """, (question_type, txt_content, png_path))
+                    print(f"更新数据库记录: {png_path}")
+                else:
+                    # 插入新记录
+                    cursor.execute("""
+                        INSERT INTO question_types (png_path, question_type, txt_content)
+                        VALUES (?, ?, ?)
+                    """, (png_path, question_type, txt_content))
+                    print(f"插入数据库记录: {png_path}")
+                
+            except Exception as e:
+                print(f"保存到数据库失败: {e}")
     
     def get_from_database(self, png_path: str = None) -> List[Dict]:
         """
@@ -431,8 +801,8 @@ class QuestionTypeAnalyzer:
             结果列表
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._reader().cursor()
+            cursor.row_factory = sqlite3.Row
             
             if png_path:
                 cursor.execute("""
@@ -445,17 +815,9 @@ class QuestionTypeAnalyzer:
                     FROM question_types ORDER BY add_time DESC
                 """)
             
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    "id": row[0],
-                    "png_path": row[1],
-                    "question_type": row[2],
-                    "txt_content": row[3],
-                    "add_time": row[4]
-                })
+            # 直接迭代游标，不先fetchall整个结果集
+            results = [dict(row) for row in cursor]
             
-            conn.close()
             return results
             
         except Exception as e:
@@ -472,30 +834,41 @@ class QuestionTypeAnalyzer:
         Returns:
             题型匹配分数字典
         """
-        text_lower = text.lower()
-        scores = {}
+        # 明显不是题目的文本不做匹配，只保留考试说明的判断
+        if len(text) < _MIN_QUESTION_LENGTH or _BOILERPLATE_RE.fullmatch(text):
+            return {"title": 10} if _is_title_text(text) else {}
         
-        for qtype, config in self.question_types.items():
-            score = 0
-            
-            # 关键词匹配
-            for keyword in config["keywords"]:
-                if keyword.lower() in text_lower:
-                    score += 1
-            
-            # 正则表达式匹配
-            for pattern in config["patterns"]:
-                if re.search(pattern, text_lower, re.IGNORECASE):
-                    score += 2  # 正则匹配权重更高
-            
-            # 特殊规则
-            score += self._apply_special_rules(qtype, text_lower)
-            
-            scores[qtype] = score
+        # 题干都在开头部分，只对前_ANALYZE_TEXT_LIMIT个字符做小写和匹配
+        text_lower = text[:_ANALYZE_TEXT_LIMIT].lower()
+        scores = dict.fromkeys(QUESTION_TYPES, 0)
+        
+        # 数学特殊规则用到的文本特征，每个文本只计算一次
+        if _HAS_MATH_RULES:
+            has_digit = bool(_DIGIT_RE.search(text_lower))
+            has_op = bool(_OP_RE.search(text_lower))
+            has_chart = any(word in text_lower for word in ("graph", "table", "chart"))
+        else:
+            has_digit = has_op = has_chart = False
+        
+        # 关键词匹配：所有题型的关键词一起查
+        for keyword, qtypes in _KEYWORD_TYPES.items():
+            if keyword in text_lower:
+                for qtype in qtypes:
+                    scores[qtype] += 1
+        
+        # 正则表达式匹配（每个命中的模式计一次）
+        for needles, regex, qtypes in _PATTERN_TABLE:
+            if all(needle in text_lower for needle in needles) and (regex is None or regex.search(text_lower)):
+                for qtype in qtypes:
+                    scores[qtype] += 2  # 正则匹配权重更高
+        
+        # 特殊规则
+        for qtype in scores:
+            scores[qtype] += self._apply_special_rules(qtype, text_lower, has_digit, has_op, has_chart)
         
         return scores
     
-    def _apply_special_rules(self, qtype: str, text: str) -> int:
+    def _apply_special_rules(self, qtype: str, text: str, has_digit: bool = False, has_op: bool = False, has_chart: bool = False) -> int:
         """应用特殊规则"""
         score = 0
         
@@ -511,9 +884,9 @@ class QuestionTypeAnalyzer:
         
         elif qtype.startswith("math-"):
             # 数学题通常有数字、公式、图表
-            if re.search(r'\d+', text) or re.search(r'[+\-*/=]', text):
+            if has_digit or has_op:
                 score += 1
-            if any(word in text for word in ["graph", "table", "chart"]):
+            if has_chart:
                 score += 1
         
         elif qtype == "essay-analysis":
@@ -533,8 +906,11 @@ class QuestionTypeAnalyzer:
         Returns:
             (最佳题型, 置信度, 所有分数)
         """
-        # 优先使用AI分析
+        # 优先使用AI分析，相同内容之前已分析过则直接复用
         if self.client:
+            cached = self._get_cached_classification(text)
+            if cached is not None:
+                return cached
             try:
                 return self._ai_classify_question(text)
             except Exception as e:
@@ -547,74 +923,210 @@ class QuestionTypeAnalyzer:
         """使用AI分析题型 - 使用更便宜的模型"""
         
         # 首先检查是否是考试说明或非题目内容
-        text_lower = text.lower()
-        title_keywords = [
-            "important reminders", "pencil required", "test security", 
-            "no.2 pencil", "mechanical pencil", "violation", "sat", "digital"
-        ]
-        
-        if any(keyword in text_lower for keyword in title_keywords):
+        if _is_title_text(text):
             return "title", 1.0, {"title": 10}
         
-        prompt = f"""
-分析这个SAT题目，选择最合适的题型。只返回题型代码，不要其他内容。
-
-**重要判断标准：**
-
-**数学题型判断：**
-- algebra: 纯数学计算，解方程、函数计算、代数运算（如：3x+4=10, f(x)=2x²-5x, 求f(8)）
-- word_problems: 有现实场景描述，需要建立数学模型的文字题（如：学生卖贴纸赚钱，需要卖多少个）
-- advanced_math: 二次方程、多项式、复杂函数（如：f(x)=(x-a)(x-b), 二次函数顶点）
-- geometry: 几何图形、面积体积计算（如：三角形面积、圆的周长）
-- trigonometry: 三角函数、直角三角形（如：sin, cos, tan, SOH-CAH-TOA）
-- coordinate_plane: 坐标平面、直线斜率、截距（如：y=mx+b, 直线截距）
-- statistics: 统计量、概率（如：平均数、中位数、概率计算）
-- data_analysis: 图表数据分析（如：表格、图表解读）
-- percents_and_ratios: 百分比、比例计算（如：30% of 200, 比例关系）
-- powers_and_roots: 指数、根号运算（如：√x, x², 指数运算）
-
-**阅读写作题型判断：**
-- words_in_context: 词汇填空、词义解释（如：Which choice completes the text...）
-- boundaries: 语法标点、句子结构（如：comma splice, run-on sentence）
-- transitions: 过渡词选择（如：however, therefore, moreover）
-- central_ideas_and_details: 主旨大意、支持细节（如：main idea, supporting details）
-- command_of_evidence_textual: 找文本证据（如：which evidence best supports...）
-- command_of_evidence_quantitative: 数据图表证据（如：table shows, graph indicates）
-- inference: 逻辑推断（如：can be inferred, suggests, implies）
-- form_structure_and_sense: 文章结构、逻辑顺序（如：logical order, sentence order）
-- text_structure_and_purpose: 文章目的结构（如：author's purpose, structure serves）
-- cross_text_connections: 多文本比较（如：both passages, two texts）
-- rhetorical_synthesis: 信息整合论证（如：synthesis, combine information）
-
-**题型代码：**
-- text_structure_and_purpose, cross_text_connections, words_in_context, central_ideas_and_details, command_of_evidence_quantitative, command_of_evidence_textual, inference, boundaries, form_structure_and_sense, transitions, rhetorical_synthesis, algebra, percents_and_ratios, advanced_math, powers_and_roots, word_problems, statistics, data_analysis, coordinate_plane, geometry, trigonometry
-
-题目内容：
-{text}
-"""
-
         try:
             # 使用更便宜的模型
-            response = self.client.chat.completions.create(
-                model="openai/gpt-4o-mini",  # 使用GPT-4o-mini，更稳定且便宜
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+            response = self._create_completion(
+                model=_AI_MODEL,
+                messages=_prompt_messages(_PROMPT_PREFIX, text),
                 max_tokens=20,  # 减少token使用
                 temperature=0.1
             )
             
-            ai_result = response.choices[0].message.content.strip().lower()
+            return self._parse_ai_result(text, response.choices[0].message.content)
+                
+        except Exception as e:
+            print(f"AI分析异常: {e}")
+            return self._rule_classify_question(text)
+    
+    def _parse_ai_result(self, text: str, ai_content: str) -> Tuple[str, float, Dict[str, float]]:
+        """解析AI返回的题型代码，未知题型回退到规则分析"""
+        ai_result = ai_content.strip().lower()
+        
+        # 验证AI返回的结果是否在预定义题型中
+        if ai_result in self.question_types:
+            self._cache_classification(text, ai_result, 0.95)
+            return ai_result, 0.95, {ai_result: 10}  # AI分析置信度很高
+        else:
+            print(f"AI返回未知题型: {ai_result}")
+            return self._rule_classify_question(text)
+    
+    def classify_questions(self, texts: List[str]) -> List[Tuple[str, float, Dict[str, float]]]:
+        """
+        分类多道题目，AI可用时一次请求完成
+        
+        Args:
+            texts: 题目文本列表
             
-            # 验证AI返回的结果是否在预定义题型中
-            if ai_result in self.question_types:
-                return ai_result, 0.95, {ai_result: 10}  # AI分析置信度很高
+        Returns:
+            与texts一一对应的(最佳题型, 置信度, 所有分数)列表
+        """
+        if len(texts) == 1:
+            return [self.classify_question(texts[0])]
+        
+        if self.client:
+            try:
+                return self._ai_classify_batch(texts)
+            except Exception as e:
+                print(f"AI批量分析失败，使用规则分析: {e}")
+        
+        return [self._rule_classify_question(text) for text in texts]
+    
+    def _ai_classify_batch(self, texts: List[str]) -> List[Tuple[str, float, Dict[str, float]]]:
+        """使用一次AI请求分析多道题目"""
+        results, pending = self._prepare_batch(texts)
+        if not pending:
+            return results
+        
+        try:
+            response = self._create_completion(
+                model=_AI_MODEL,
+                messages=_prompt_messages(_BATCH_PROMPT_PREFIX, self._build_batch_prompt(texts, pending)),
+                max_tokens=20 * len(pending),
+                temperature=0.1
+            )
+            ai_content = response.choices[0].message.content
+        except Exception as e:
+            print(f"AI批量分析异常: {e}")
+            ai_content = ""
+        
+        return self._parse_batch_result(texts, pending, ai_content, results)
+    
+    def _prepare_batch(self, texts: List[str]) -> Tuple[List[Optional[Tuple[str, float, Dict[str, float]]]], List[int]]:
+        """预先处理考试说明类内容和已缓存的题目，返回(结果列表, 需要AI分析的题目下标)"""
+        results = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if _is_title_text(text):
+                results[i] = ("title", 1.0, {"title": 10})
             else:
-                print(f"AI返回未知题型: {ai_result}")
-                return self._rule_classify_question(text)
+                results[i] = self._get_cached_classification(text)
+                if results[i] is None:
+                    pending.append(i)
+        return results, pending
+    
+    def _build_batch_prompt(self, texts: List[str], pending: List[int]) -> str:
+        """构建批量分析的题目列表，序号从1开始"""
+        return "".join(f"\n### {n}.\n{texts[i]}\n" for n, i in enumerate(pending, 1))
+    
+    def _parse_batch_result(self, texts: List[str], pending: List[int], ai_content: str,
+                            results: List[Optional[Tuple[str, float, Dict[str, float]]]]) -> List[Tuple[str, float, Dict[str, float]]]:
+        """解析批量结果，缺失或未知的题型逐题回退到规则分析"""
+        codes = {int(n): code for n, code in _BATCH_LINE_RE.findall(ai_content.lower())}
+        for n, i in enumerate(pending, 1):
+            code = codes.get(n)
+            if code in self.question_types:
+                self._cache_classification(texts[i], code, 0.95)
+                results[i] = (code, 0.95, {code: 10})
+            else:
+                print(f"AI返回未知题型: 第{n}题 {code}")
+                results[i] = self._rule_classify_question(texts[i])
+        return results
+    
+    def _create_completion(self, **kwargs):
+        """调用chat.completions.create，遇到速率限制或超时按指数退避重试"""
+        for attempt in range(_AI_MAX_RETRIES + 1):
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except (openai.RateLimitError, openai.APITimeoutError) as e:
+                if attempt >= _AI_MAX_RETRIES:
+                    raise
+                wait_time = _AI_BACKOFF_FACTOR ** attempt
+                print(f"  AI请求受限或超时 (尝试 {attempt + 1}/{_AI_MAX_RETRIES + 1}): {e}，等待 {wait_time:.1f} 秒后重试...")
+                time.sleep(wait_time)
+    
+    async def _create_completion_async(self, **kwargs) -> str:
+        """
+        _create_completion的异步版本，返回回复文本，退避等待不阻塞事件循环。
+        安装了aiohttp时直接POST接口，只取需要的choices[0].message.content，不经过SDK
+        """
+        for attempt in range(_AI_MAX_RETRIES + 1):
+            try:
+                if aiohttp is not None:
+                    return await self._post_chat_completion(kwargs)
+                response = await self.aclient.chat.completions.create(**kwargs)
+                return response.choices[0].message.content
+            except Exception as e:
+                if not _is_retryable_error(e) or attempt >= _AI_MAX_RETRIES:
+                    raise
+                wait_time = _AI_BACKOFF_FACTOR ** attempt
+                print(f"  AI请求受限或超时 (尝试 {attempt + 1}/{_AI_MAX_RETRIES + 1}): {e}，等待 {wait_time:.1f} 秒后重试...")
+                await asyncio.sleep(wait_time)
+    
+    async def _post_chat_completion(self, payload: Dict[str, Any]) -> str:
+        """直接POST chat/completions，返回回复文本；非2xx状态抛出aiohttp.ClientResponseError"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, limit_per_host=100, ttl_dns_cache=300),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=aiohttp.ClientTimeout(total=120),
+                raise_for_status=True
+            )
+        async with self._session.post(_CHAT_COMPLETIONS_URL, json=payload) as response:
+            data = await response.json()
+        return data["choices"][0]["message"]["content"]
+    
+    async def classify_questions_async(self, texts: List[str]) -> List[Tuple[str, float, Dict[str, float]]]:
+        """分类多道题目（异步版本）"""
+        if len(texts) == 1:
+            return [await self.classify_question_async(texts[0])]
+        
+        if self.client:
+            try:
+                return await self._ai_classify_batch_async(texts)
+            except Exception as e:
+                print(f"AI批量分析失败，使用规则分析: {e}")
+        
+        return [self._rule_classify_question(text) for text in texts]
+    
+    async def _ai_classify_batch_async(self, texts: List[str]) -> List[Tuple[str, float, Dict[str, float]]]:
+        """使用一次AI请求分析多道题目（异步版本）"""
+        results, pending = self._prepare_batch(texts)
+        if not pending:
+            return results
+        
+        try:
+            ai_content = await self._create_completion_async(
+                model=_AI_MODEL,
+                messages=_prompt_messages(_BATCH_PROMPT_PREFIX, self._build_batch_prompt(texts, pending)),
+                max_tokens=20 * len(pending),
+                temperature=0.1
+            )
+        except Exception as e:
+            print(f"AI批量分析异常: {e}")
+            ai_content = ""
+        
+        return self._parse_batch_result(texts, pending, ai_content, results)
+    
+    async def classify_question_async(self, text: str) -> Tuple[str, float, Dict[str, float]]:
+        """分类题目（异步版本，AI请求不阻塞事件循环）"""
+        if self.client:
+            cached = self._get_cached_classification(text)
+            if cached is not None:
+                return cached
+            try:
+                return await self._ai_classify_question_async(text)
+            except Exception as e:
+                print(f"AI分析失败，使用规则分析: {e}")
+        
+        return self._rule_classify_question(text)
+    
+    async def _ai_classify_question_async(self, text: str) -> Tuple[str, float, Dict[str, float]]:
+        """使用AI分析题型（异步版本）"""
+        if _is_title_text(text):
+            return "title", 1.0, {"title": 10}
+        
+        try:
+            ai_content = await self._create_completion_async(
+                model=_AI_MODEL,
+                messages=_prompt_messages(_PROMPT_PREFIX, text),
+                max_tokens=20,
+                temperature=0.1
+            )
+            
+            return self._parse_ai_result(text, ai_content)
                 
         except Exception as e:
             print(f"AI分析异常: {e}")
@@ -637,7 +1149,8 @@ class QuestionTypeAnalyzer:
         
         return best_type, confidence, scores
     
-    def analyze_file(self, file_path: Path, save_to_db: bool = True, force_reanalyze: bool = False, skip_cached: bool = False) -> Dict:
+    def analyze_file(self, file_path: Path, save_to_db: bool = True, force_reanalyze: bool = False, skip_cached: bool = False, has_cached_type: Optional[bool] = None,
+                     questions: Optional[List[Dict[str, Any]]] = None, classified: Optional[Dict[str, Tuple[str, float, Dict[str, float]]]] = None) -> Dict:
         """
         分析单个文件
         
@@ -646,17 +1159,54 @@ class QuestionTypeAnalyzer:
             save_to_db: 是否保存到数据库
             force_reanalyze: 是否强制重新分析（忽略.type.txt文件）
             skip_cached: 是否跳过已存在.type.txt文件的处理
+            has_cached_type: 是否已知存在.type.txt文件（批量扫描时传入，None表示需要检查文件系统）
+            questions: 已解析的题目列表，None表示从文件读取
+            classified: 已完成的分类结果 {题目文本: (题型, 置信度, 分数)}，命中时不再调用classify_question
             
         Returns:
             分析结果字典
         """
         try:
-            # 读取文件内容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            type_file = _type_file_path(file_path)
+            saved_type_text = None
+            if has_cached_type is None and not force_reanalyze:
+                # 直接尝试读取，不存在时捕获FileNotFoundError，省去单独的exists()检查
+                try:
+                    with open(type_file, 'r', encoding='utf-8') as f:
+                        saved_type_text = f.read()
+                except FileNotFoundError:
+                    pass
+                has_cached_type = saved_type_text is not None
+            
+            # 已有.type.txt且设置了跳过缓存，无需读取文件
+            if has_cached_type and skip_cached and not force_reanalyze:
+                return {
+                    "filename": file_path.name,
+                    "filepath": str(file_path),
+                    "skipped": True,
+                    "reason": "type_file_exists"
+                }
+            
+            if has_cached_type and not force_reanalyze and saved_type_text is None:
+                with open(type_file, 'r', encoding='utf-8') as f:
+                    saved_type_text = f.read()
             
-            # 尝试解析为JSON格式
-            questions = self.parse_json_content(content)
+            if questions is None:
+                # 读取文件内容
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                
+                # 尝试解析为JSON格式
+                questions = self.parse_json_content(content)
+            
+            classify = self.classify_question
+            classify_all = self.classify_questions
+            if classified:
+                def classify(text):
+                    return classified.get(text) or self.classify_question(text)
+                
+                def classify_all(texts):
+                    return [classify(text) for text in texts]
             
             if len(questions) > 1:
                 # 多题目文件
@@ -666,20 +1216,12 @@ class QuestionTypeAnalyzer:
                 results = []
                 
                 # 检查是否存在.type.txt文件
-                type_file = file_path.with_suffix('.type.txt')
-                if type_file.exists() and not force_reanalyze:
-                    if skip_cached:
-                        # 如果设置了跳过缓存，直接返回跳过信息
-                        return {
-                            "filename": file_path.name,
-                            "filepath": str(file_path),
-                            "skipped": True,
-                            "reason": "type_file_exists"
-                        }
+                if has_cached_type and not force_reanalyze:
+                    # 如果.type.txt文件存在且不强制重新分析，直接使用
+                    saved_types = saved_type_text.strip().split(',')
                     
-                    # 如果.type.txt文件存在且不强制重新分析，直接读取
-                    with open(type_file, 'r', encoding='utf-8') as f:
-                        saved_types = f.read().strip().split(',')
+                    # .type.txt中缺少的题目一次性分析
+                    extra = classify_all([q["content"] for q in questions[len(saved_types):]]) if len(questions) > len(saved_types) else []
                     
                     # 使用保存的题型
                     for i, question in enumerate(questions):
@@ -688,7 +1230,7 @@ class QuestionTypeAnalyzer:
                             qtype = saved_types[i]
                             confidence = 1.0  # 从文件读取的置信度为1.0
                         else:
-                            qtype, confidence, scores = self.classify_question(question_text)
+                            qtype, confidence, scores = extra[i - len(saved_types)]
                         
                         question_types.append(qtype)
                         confidences.append(confidence)
@@ -718,9 +1260,11 @@ class QuestionTypeAnalyzer:
                         "source": "type_file"
                     }
                 
-                for i, question in enumerate(questions):
+                # 文件中的所有题目一次请求完成分类
+                classifications = classify_all([q["content"] for q in questions])
+                
+                for question, (qtype, confidence, scores) in zip(questions, classifications):
                     question_text = question["content"]
-                    qtype, confidence, scores = self.classify_question(question_text)
                     question_types.append(qtype)
                     confidences.append(confidence)
                     
@@ -741,12 +1285,11 @@ class QuestionTypeAnalyzer:
                 
                 # 为多题目文件生成.type.txt文件（包含所有题型）
                 try:
-                    type_file = file_path.with_suffix('.type.txt')
                     # 将多个题型用逗号分隔保存
                     all_types = ','.join(question_types)
                     with open(type_file, 'w', encoding='utf-8') as f:
                         f.write(all_types)
-                    print(f"  保存题型到文件: {type_file.name} ({all_types})")
+                    print(f"  保存题型到文件: {os.path.basename(type_file)} ({all_types})")
                 except Exception as e:
                     print(f"  保存.type.txt文件失败: {e}")
                 
@@ -763,20 +1306,9 @@ class QuestionTypeAnalyzer:
                 question_text = question["content"]
                 
                 # 检查是否存在.type.txt文件
-                type_file = file_path.with_suffix('.type.txt')
-                if type_file.exists() and not force_reanalyze:
-                    if skip_cached:
-                        # 如果设置了跳过缓存，直接返回跳过信息
-                        return {
-                            "filename": file_path.name,
-                            "filepath": str(file_path),
-                            "skipped": True,
-                            "reason": "type_file_exists"
-                        }
-                    
-                    # 如果.type.txt文件存在且不强制重新分析，直接读取
-                    with open(type_file, 'r', encoding='utf-8') as f:
-                        qtype = f.read().strip()
+                if has_cached_type and not force_reanalyze:
+                    # 如果.type.txt文件存在且不强制重新分析，直接使用
+                    qtype = saved_type_text.strip()
                     
                     result = {
                         "filename": file_path.name,
@@ -791,7 +1323,7 @@ class QuestionTypeAnalyzer:
                     print(f"  从.type.txt文件读取题型: {qtype}")
                 else:
                     # 进行AI分析
-                    qtype, confidence, scores = self.classify_question(question_text)
+                    qtype, confidence, scores = classify(question_text)
                     
                     result = {
                         "filename": file_path.name,
@@ -807,7 +1339,7 @@ class QuestionTypeAnalyzer:
                     try:
                         with open(type_file, 'w', encoding='utf-8') as f:
                             f.write(qtype)
-                        print(f"  保存题型到文件: {type_file.name}")
+                        print(f"  保存题型到文件: {os.path.basename(type_file)}")
                     except Exception as e:
                         print(f"  保存.type.txt文件失败: {e}")
                 
@@ -863,33 +1395,206 @@ class QuestionTypeAnalyzer:
             print(f"目录不存在: {directory}")
             return results
         
-        txt_files = list(directory.rglob(pattern))
-        total_files = len(txt_files)
+        cached_map, txt_files = self._collect_txt_files(directory, pattern, max_files)
         
-        # 过滤文件：只保留主要的.txt文件，排除.type.txt和系统文件
-        txt_files = [f for f in txt_files if 
-                    f.name.endswith('.txt') and 
-                    not f.name.endswith('.type.txt') and 
-                    not f.name.startswith('._')]
-        
-        # 自然排序文件（按数字顺序）
-        def natural_sort_key(file_path):
-            # 提取文件名中的数字部分进行排序
-            filename = file_path.name
-            # 移除扩展名
-            name_without_ext = filename.rsplit('.', 1)[0]
-            # 提取数字部分
-            import re
-            numbers = re.findall(r'\d+', name_without_ext)
-            if numbers:
-                # 返回第一个数字作为排序键
-                return int(numbers[0])
-            else:
-                # 如果没有数字，按文件名排序
-                return filename
+        results = [None] * len(txt_files)  # 预分配结果列表
+        
+        print(f"开始多线程处理，使用 {max_workers} 个线程...")
+        
+        # 工作线程只做分析，结果由主线程按完成顺序逐个取出并打印进度，不需要加锁
+        analyzed = self.analyze_files(txt_files, workers=max_workers, force_reanalyze=force_reanalyze,
+                                      skip_cached=skip_cached, cached_map=cached_map)
+        # 进度先写入内存缓冲，每_PROGRESS_FLUSH_EVERY个文件（以及最后一个文件）输出一次
+        progress = io.StringIO()
+        for completed_count, (index, result) in enumerate(analyzed, 1):
+            results[index - 1] = result
+            self._print_progress(index, len(txt_files), result, completed_count, out=progress)
+            if completed_count % _PROGRESS_FLUSH_EVERY == 0 or completed_count == len(txt_files):
+                _flush_progress(progress)
+        
+        return results
+    
+    def analyze_files(self, paths: List[Path], workers: int = 16, force_reanalyze: bool = False, skip_cached: bool = False,
+                      cached_map: Optional[Dict[Path, bool]] = None) -> Iterator[Tuple[int, Dict]]:
+        """
+        用固定数量的工作线程并发分析多个文件，按完成顺序逐个产出结果。
+        工作线程从任务队列取文件，不为每个文件创建Future；调用方提前结束迭代时，剩余文件不再分析
+        
+        Args:
+            paths: 文件路径列表
+            workers: 线程数
+            force_reanalyze: 是否强制重新分析（忽略.type.txt文件）
+            skip_cached: 是否跳过已存在.type.txt文件的处理
+            cached_map: 可选的{文件: 是否有.type.txt}，来自目录扫描
+            
+        Yields:
+            (序号, 分析结果)，序号为文件在paths中的位置，从1开始
+        """
+        if workers < 1:
+            # 与ThreadPoolExecutor一致；没有工作线程时等待结果会一直阻塞
+            raise ValueError("workers must be greater than 0")
+        if cached_map is None and not force_reanalyze:
+            cached_map = _cached_type_map(paths)
+        
+        work_queue = Queue()
+        for item in enumerate(paths, 1):
+            work_queue.put(item)
+        result_queue = SimpleQueue()
+        
+        def worker():
+            while True:
+                try:
+                    index, file_path = work_queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    result = self.analyze_file(file_path, force_reanalyze=force_reanalyze, skip_cached=skip_cached,
+                                               has_cached_type=cached_map.get(file_path) if cached_map else None)
+                except Exception as e:
+                    result = {"error": str(e), "filename": file_path.name}
+                result_queue.put((index, result))
+        
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(workers, len(paths)))]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            for _ in range(len(paths)):
+                yield result_queue.get()
+        finally:
+            # 提前结束时清空任务队列，工作线程处理完手头的文件后退出
+            while True:
+                try:
+                    work_queue.get_nowait()
+                except Empty:
+                    break
+            for thread in threads:
+                thread.join()
+    
+    async def analyze_file_async(self, file_path: Path, save_to_db: bool = True, force_reanalyze: bool = False, skip_cached: bool = False, has_cached_type: Optional[bool] = None) -> Dict:
+        """
+        异步分析单个文件：文件中所有题目的AI分类在一次异步请求中完成，
+        其余流程（.type.txt、数据库）复用analyze_file，在线程中运行
+        
+        Args:
+            同analyze_file
+            
+        Returns:
+            分析结果字典
+        """
+        if has_cached_type is None:
+            has_cached_type = os.path.exists(_type_file_path(file_path))
+        
+        if has_cached_type and not force_reanalyze:
+            # 有.type.txt文件时不需要AI分析
+            return await asyncio.to_thread(self.analyze_file, file_path, save_to_db, force_reanalyze, skip_cached, has_cached_type)
+        
+        try:
+            content = await asyncio.to_thread(file_path.read_text, encoding='utf-8')
+        except Exception as e:
+            return {
+                "filename": file_path.name,
+                "filepath": str(file_path),
+                "error": str(e)
+            }
+        
+        questions = self.parse_json_content(content)
+        texts = [question["content"] for question in questions]
+        classifications = await self.classify_questions_async(texts) if texts else []
+        
+        return await asyncio.to_thread(self.analyze_file, file_path, save_to_db, force_reanalyze, skip_cached, has_cached_type,
+                                       questions, dict(zip(texts, classifications)))
+    
+    async def batch_analyze_async(self, directory: Path, pattern: str = "*.txt", max_files: Optional[int] = None, force_reanalyze: bool = False, concurrency: int = _ASYNC_CONCURRENCY, skip_cached: bool = False) -> List[Dict]:
+        """
+        批量分析目录中的文件（asyncio并发，使用AsyncOpenAI）
+        
+        Args:
+            directory: 目录路径
+            pattern: 文件匹配模式
+            max_files: 最大处理文件数
+            force_reanalyze: 是否强制重新分析（忽略.type.txt文件）
+            concurrency: 同时处理的最大文件数
+            skip_cached: 是否跳过已存在.type.txt文件的处理
+            
+        Returns:
+            分析结果列表
+        """
+        if not directory.exists():
+            print(f"目录不存在: {directory}")
+            return []
+        
+        cached_map, txt_files = self._collect_txt_files(directory, pattern, max_files)
+        completed_count = 0
+        progress = io.StringIO()
+        
+        def on_result(index: int, result: Dict):
+            # 事件循环单线程运行，无需加锁
+            nonlocal completed_count
+            completed_count += 1
+            self._print_progress(index, len(txt_files), result, completed_count, out=progress)
+            if completed_count % _PROGRESS_FLUSH_EVERY == 0 or completed_count == len(txt_files):
+                _flush_progress(progress)
+        
+        print(f"开始异步处理，最大并发 {concurrency}...")
+        
+        return await self.analyze_files_async(txt_files, concurrency, force_reanalyze=force_reanalyze, skip_cached=skip_cached,
+                                              cached_map=cached_map, on_result=on_result)
+    
+    async def analyze_files_async(self, paths: List[Path], concurrency: int = _ASYNC_CONCURRENCY, force_reanalyze: bool = False, skip_cached: bool = False,
+                                  cached_map: Optional[Dict[Path, bool]] = None, on_result=None) -> List[Dict]:
+        """
+        并发分析多个文件，同时进行中的文件数不超过concurrency
+        
+        Args:
+            paths: 文件路径列表
+            concurrency: 最大并发数
+            force_reanalyze: 是否强制重新分析（忽略.type.txt文件）
+            skip_cached: 是否跳过已存在.type.txt文件的处理
+            cached_map: 可选的{文件: 是否有.type.txt}，来自目录扫描
+            on_result: 可选回调 on_result(序号, 结果)，每个文件完成时调用，序号从1开始
+            
+        Returns:
+            与paths顺序一致的分析结果列表
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be greater than 0")
+        if cached_map is None and not force_reanalyze:
+            cached_map = _cached_type_map(paths)
+        
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def run(index: int, file_path: Path) -> Dict:
+            async with sem:
+                try:
+                    result = await self.analyze_file_async(file_path, force_reanalyze=force_reanalyze, skip_cached=skip_cached,
+                                                           has_cached_type=cached_map.get(file_path) if cached_map else None)
+                except Exception as e:
+                    result = {"error": str(e), "filename": file_path.name}
+            if on_result:
+                on_result(index, result)
+            return result
+        
+        return list(await asyncio.gather(*(run(i, file_path) for i, file_path in enumerate(paths, 1))))
+    
+    async def aclose(self):
+        """关闭异步客户端、aiohttp会话的连接池和数据库连接（在事件循环结束前调用）"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self.aclient:
+            await self.aclient.close()
+        self.close()
+    
+    def _collect_txt_files(self, directory: Path, pattern: str, max_files: Optional[int]) -> Tuple[Dict[Path, bool], List[Path]]:
+        """扫描、排序并截取待处理的题目文件，返回({文件: 是否有.type.txt}, 文件列表)"""
+        # 一次扫描同时得到题目文件及其.type.txt是否存在
+        cached_map = _scan_txt_files(directory, pattern)
+        txt_files = list(cached_map)
+        total_files = len(txt_files)
         
         # 按自然顺序排序
-        txt_files.sort(key=natural_sort_key)
+        txt_files.sort(key=_natural_sort_key)
         
         # 限制文件数量
         if max_files:
@@ -898,62 +1603,179 @@ class QuestionTypeAnalyzer:
         else:
             print(f"找到 {total_files} 个文本文件")
         
-        # 线程安全的分析单个文件
-        def analyze_file_thread_safe(file_path: Path) -> Tuple[int, Dict]:
-            try:
-                result = self.analyze_file(file_path, force_reanalyze=force_reanalyze, skip_cached=skip_cached)
-                return (txt_files.index(file_path) + 1, result)
-            except Exception as e:
-                return (txt_files.index(file_path) + 1, {"error": str(e), "filename": file_path.name})
+        return cached_map, txt_files
+    
+    def _print_progress(self, index: int, total: int, result: Dict, completed_count: int, out=None):
+        """显示单个文件的分析结果和总体进度，out为输出目标（默认sys.stdout）"""
+        if "skipped" in result:
+            # 跳过的文件
+            print(f"[{index}/{total}] 跳过: {result['filename']} - {result['reason']}", file=out)
+        elif "error" not in result:
+            if "questions" in result:
+                # 多题目文件
+                print(f"[{index}/{total}] 分析: {result['filename']} - 题目数量: {result['question_count']}", file=out)
+                for j, question in enumerate(result['questions'], 1):
+                    print(f"    题目{j}: {question['question_type']} (置信度: {question['confidence']:.2f})", file=out)
+            else:
+                # 单题目文件
+                print(f"[{index}/{total}] 分析: {result['filename']} - 题型: {result['question_type']} (置信度: {result['confidence']:.2f})", file=out)
+        else:
+            print(f"[{index}/{total}] 分析: {result['filename']} - 错误: {result['error']}", file=out)
         
-        # 多线程处理
-        results = [None] * len(txt_files)  # 预分配结果列表
-        completed_count = 0
-        lock = threading.Lock()
+        print(f"进度: {completed_count}/{total} ({completed_count/total*100:.1f}%)", file=out)
+    
+    def submit_batch(self, files: List[Path], batch_file: str = "batch.jsonl", model: str = _BATCH_MODEL) -> Optional[str]:
+        """
+        离线批量分析：生成Batch API请求文件并提交（24小时内完成，费用减半）
         
-        def update_progress(index: int, result: Dict):
-            nonlocal completed_count
-            with lock:
-                results[index - 1] = result
-                completed_count += 1
-                
-                # 显示进度
-                if "skipped" in result:
-                    # 跳过的文件
-                    print(f"[{index}/{len(txt_files)}] 跳过: {result['filename']} - {result['reason']}")
-                elif "error" not in result:
-                    if "questions" in result:
-                        # 多题目文件
-                        print(f"[{index}/{len(txt_files)}] 分析: {result['filename']} - 题目数量: {result['question_count']}")
-                        for j, question in enumerate(result['questions'], 1):
-                            print(f"    题目{j}: {question['question_type']} (置信度: {question['confidence']:.2f})")
-                    else:
-                        # 单题目文件
-                        print(f"[{index}/{len(txt_files)}] 分析: {result['filename']} - 题型: {result['question_type']} (置信度: {result['confidence']:.2f})")
-                else:
-                    print(f"[{index}/{len(txt_files)}] 分析: {result['filename']} - 错误: {result['error']}")
+        Batch API只有OpenAI官方接口支持，使用OPENAI_API_KEY和默认的OpenAI地址，
+        不经过OpenRouter
+        
+        Args:
+            files: 题目文件列表
+            batch_file: 生成的JSONL请求文件
+            model: OpenAI模型名称
+            
+        Returns:
+            batch ID，提交失败或没有题目时返回None
+        """
+        request_count = 0
+        with open(batch_file, 'w', encoding='utf-8') as f:
+            for file_path in files:
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as qf:
+                        questions = self.parse_json_content(qf.read())
+                except Exception as e:
+                    print(f"读取文件失败: {file_path} - {e}")
+                    continue
                 
-                print(f"进度: {completed_count}/{len(txt_files)} ({completed_count/len(txt_files)*100:.1f}%)")
+                for index, question in enumerate(questions):
+                    # 考试说明类内容在导入结果时本地识别，不需要请求
+                    if _is_title_text(question["content"]):
+                        continue
+                    request = {
+                        "custom_id": json.dumps([str(file_path), index], ensure_ascii=False),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": {
+                            "model": model,
+                            "messages": _prompt_messages(_PROMPT_PREFIX, question["content"]),
+                            "max_tokens": 20,
+                            "temperature": 0.1
+                        }
+                    }
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+                    request_count += 1
         
-        print(f"开始多线程处理，使用 {max_workers} 个线程...")
+        print(f"生成批量请求文件: {batch_file} ({request_count} 个请求)")
+        if not request_count:
+            return None
         
-        # 使用线程池执行
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_file = {executor.submit(analyze_file_thread_safe, file_path): file_path for file_path in txt_files}
+        try:
+            client = self._batch_client()
+            with open(batch_file, 'rb') as f:
+                input_file = client.files.create(file=f, purpose="batch")
+            batch = client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            print(f"批量任务已提交: {batch.id}")
+            return batch.id
+        except Exception as e:
+            print(f"提交批量任务失败: {e}")
+            return None
+    
+    def ingest_batch(self, batch_id: str, wait: bool = False, poll_interval: int = 60) -> Optional[int]:
+        """
+        导入批量任务结果：写入.type.txt文件和数据库
+        
+        Args:
+            batch_id: submit_batch返回的batch ID
+            wait: 任务未完成时是否轮询等待
+            poll_interval: 轮询间隔（秒）
+            
+        Returns:
+            导入的题目数，任务未完成或失败时返回None
+        """
+        try:
+            client = self._batch_client()
+            batch = client.batches.retrieve(batch_id)
+            while wait and batch.status in ("validating", "in_progress", "finalizing"):
+                print(f"批量任务状态: {batch.status}，{poll_interval} 秒后重新查询...")
+                time.sleep(poll_interval)
+                batch = client.batches.retrieve(batch_id)
             
-            # 处理完成的任务
-            for future in concurrent.futures.as_completed(future_to_file):
-                index, result = future.result()
-                update_progress(index, result)
+            if batch.status != "completed" or not batch.output_file_id:
+                print(f"批量任务未完成: {batch.status}")
+                return None
+            
+            output = client.files.content(batch.output_file_id).text
+        except Exception as e:
+            print(f"获取批量任务结果失败: {e}")
+            return None
         
-        return results
+        # {文件路径: {题目序号: 题型代码}}
+        file_codes = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            file_path, index = json.loads(item["custom_id"])
+            try:
+                code = item["response"]["body"]["choices"][0]["message"]["content"].strip().lower()
+            except (KeyError, IndexError, TypeError):
+                code = None
+            file_codes.setdefault(file_path, {})[index] = code
+        
+        question_count = 0
+        for file_path, codes in file_codes.items():
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    questions = self.parse_json_content(f.read())
+            except Exception as e:
+                print(f"读取文件失败: {file_path} - {e}")
+                continue
+            
+            question_types = []
+            confidences = []
+            for index, question in enumerate(questions):
+                code = codes.get(index)
+                if code in self.question_types:
+                    qtype, confidence = code, 0.95
+                elif _is_title_text(question["content"]):
+                    qtype, confidence = "title", 1.0
+                else:
+                    qtype, confidence, _ = self._rule_classify_question(question["content"])
+                question_types.append(qtype)
+                confidences.append(confidence)
+            
+            try:
+                with open(_type_file_path(file_path), 'w', encoding='utf-8') as f:
+                    f.write(','.join(question_types))
+            except Exception as e:
+                print(f"  保存.type.txt文件失败: {e}")
+            
+            self.save_questions_to_database(file_path, questions, question_types, confidences)
+            question_count += len(questions)
+        
+        print(f"批量任务结果已导入: {len(file_codes)} 个文件, {question_count} 道题目")
+        return question_count
+    
+    def _batch_client(self):
+        """Batch API客户端（OpenAI官方地址）"""
+        return openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY') or self.api_key)
     
     def save_results(self, results: List[Dict], output_file: str = "question_types.json"):
         """保存分析结果"""
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            if orjson is not None:
+                # C实现的编码器，直接写入UTF-8字节
+                with open(output_file, 'wb') as f:
+                    f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            else:
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(results, f, ensure_ascii=False, indent=2)
             print(f"结果已保存到: {output_file}")
         except Exception as e:
             print(f"保存失败: {e}")
@@ -968,6 +1790,8 @@ class QuestionTypeAnalyzer:
         total_files = 0
         total_questions = 0
         skipped_files = 0
+        success_files = 0
+        error_files = 0
         
         for result in results:
             if "skipped" in result:
@@ -975,6 +1799,7 @@ class QuestionTypeAnalyzer:
                 skipped_files += 1
                 continue
             elif "error" not in result:
+                success_files += 1
                 if "questions" in result:
                     # 多题目文件
                     total_files += 1
@@ -988,6 +1813,8 @@ class QuestionTypeAnalyzer:
                     type_counts[qtype] = type_counts.get(qtype, 0) + 1
                     total_files += 1
                     total_questions += 1
+            else:
+                error_files += 1
         
         # 生成报告
         report = f"""
@@ -996,8 +1823,8 @@ SAT题型分析报告
 
 总文件数: {total_files}
 总题目数: {total_questions}
-成功分析: {len([r for r in results if "error" not in r and "skipped" not in r])}
-分析失败: {len([r for r in results if "error" in r])}
+成功分析: {success_files}
+分析失败: {error_files}
 跳过文件: {skipped_files}
 
 题型分布:
@@ -1005,7 +1832,7 @@ SAT题型分析报告
         
         for qtype, count in sorted(type_counts.items(), key=lambda x: x[1], reverse=True):
             percentage = (count / total_questions) * 100 if total_questions > 0 else 0
-            description = self.question_types.get(qtype, {}).get("description", "未知题型")
+            description = self._descriptions.get(qtype, "未知题型")
             report += f"  {qtype}: {count} 题 ({percentage:.1f}%) - {description}\n"
         
         return report
@@ -1013,34 +1840,23 @@ SAT题型分析报告
     def generate_database_summary(self) -> str:
         """生成数据库统计报告"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 获取旧表统计
-            cursor.execute("SELECT COUNT(*) FROM question_types")
-            old_total_count = cursor.fetchone()[0]
+            cursor = self._reader().cursor()
             
-            # 获取新表统计
-            cursor.execute("SELECT COUNT(*) FROM questions")
-            new_total_count = cursor.fetchone()[0]
-            
-            # 获取新表题型分布
-            cursor.execute("""
-                SELECT question_type, COUNT(*) as count
-                FROM questions 
-                GROUP BY question_type 
-                ORDER BY count DESC
-            """)
-            new_type_distribution = cursor.fetchall()
+            # 题型分布和占比在SQLite中一次算出（窗口函数求总数），总记录数由各题型数量相加
+            def type_distribution(table: str) -> List[Tuple[str, int, float]]:
+                cursor.execute(f"""
+                    SELECT question_type, COUNT(*) AS count,
+                           COUNT(*) * 100.0 / SUM(COUNT(*)) OVER () AS percentage
+                    FROM {table}
+                    GROUP BY question_type
+                    ORDER BY count DESC
+                """)
+                return cursor.fetchall()
             
-            # 获取旧表题型分布
-            cursor.execute("""
-                SELECT question_type, COUNT(*) as count
-                FROM question_types 
-                GROUP BY question_type 
-                ORDER BY count DESC
-            """)
-            old_type_distribution = cursor.fetchall()
+            new_type_distribution = type_distribution("questions")
+            old_type_distribution = type_distribution("question_types")
+            new_total_count = sum(count for _, count, _ in new_type_distribution)
+            old_total_count = sum(count for _, count, _ in old_type_distribution)
             
             # 获取最新记录
             cursor.execute("""
@@ -1051,8 +1867,6 @@ SAT题型分析报告
             """)
             recent_records = cursor.fetchall()
             
-            conn.close()
-            
             # 生成报告
             report = f"""
 数据库题型分析报告
@@ -1064,16 +1878,14 @@ SAT题型分析报告
 
 新格式题型分布:
 """
-            for qtype, count in new_type_distribution:
-                percentage = (count / new_total_count) * 100 if new_total_count > 0 else 0
-                description = self.question_types.get(qtype, {}).get("description", "未知题型")
+            for qtype, count, percentage in new_type_distribution:
+                description = self._descriptions.get(qtype, "未知题型")
                 report += f"  {qtype}: {count} 题 ({percentage:.1f}%) - {description}\n"
             
             if old_type_distribution:
                 report += "\n旧格式题型分布:\n"
-                for qtype, count in old_type_distribution:
-                    percentage = (count / old_total_count) * 100 if old_total_count > 0 else 0
-                    description = self.question_types.get(qtype, {}).get("description", "未知题型")
+                for qtype, count, percentage in old_type_distribution:
+                    description = self._descriptions.get(qtype, "未知题型")
                     report += f"  {qtype}: {count} 题 ({percentage:.1f}%) - {description}\n"
             
             report += "\n最新记录:\n"
@@ -1101,6 +1913,10 @@ def main():
     parser.add_argument("--max-workers", "-w", type=int, default=5, help="最大线程数 (默认: 5)")
     parser.add_argument("--force-reanalyze", action="store_true", help="强制重新分析，忽略.type.txt文件")
     parser.add_argument("--skip-cached", action="store_true", help="跳过已存在.type.txt文件的处理，不更新数据库")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="使用asyncio并发处理（并发数由--max-workers指定）")
+    parser.add_argument("--batch-submit", action="store_true", help="为输入目录生成并提交Batch API离线任务")
+    parser.add_argument("--batch-ingest", type=str, metavar="BATCH_ID", help="导入Batch API任务结果到.type.txt和数据库")
+    parser.add_argument("--batch-wait", action="store_true", help="配合--batch-ingest使用，任务未完成时轮询等待")
     
     # 数据库相关选项
     parser.add_argument("--db-query", action="store_true", help="查询数据库中的所有记录")
@@ -1120,7 +1936,15 @@ def main():
         print("或使用 --no-ai 参数禁用AI分析")
     
     analyzer = QuestionTypeAnalyzer(api_key=api_key if not args.no_ai else None)
-    
+    try:
+        run(analyzer, args)
+    finally:
+        # 关闭数据库连接（写连接关闭前执行PRAGMA optimize更新统计信息）
+        analyzer.close()
+
+
+def run(analyzer: QuestionTypeAnalyzer, args: argparse.Namespace):
+    """按命令行参数执行查询或分析"""
     # 数据库查询功能
     if args.db_query:
         print("=== 数据库查询 ===")
@@ -1153,12 +1977,14 @@ def main():
     
     if args.db_questions:
         print("=== 查询新格式数据库 ===")
-        results = analyzer.get_questions_from_database()
-        print(f"总题目数: {len(results)}")
-        for result in results[:10]:  # 显示前10条
-            print(f"  {result['file_path']} - {result['question_id']} -> {result['question_type']} ({result['add_time']})")
-        if len(results) > 10:
-            print(f"  ... 还有 {len(results) - 10} 条记录")
+        total = 0
+        for result in analyzer.iter_questions_from_database():
+            if total < 10:  # 显示前10条
+                print(f"  {result['file_path']} - {result['question_id']} -> {result['question_type']} ({result['add_time']})")
+            total += 1
+        if total > 10:
+            print(f"  ... 还有 {total - 10} 条记录")
+        print(f"总题目数: {total}")
         return
     
     if args.db_file:
@@ -1178,6 +2004,11 @@ def main():
             print("未找到记录")
         return
     
+    if args.batch_ingest:
+        print(f"=== 导入批量任务: {args.batch_ingest} ===")
+        analyzer.ingest_batch(args.batch_ingest, wait=args.batch_wait)
+        return
+    
     # 检查是否提供了输入路径
     if not args.input:
         print("请提供输入文件或目录路径，或使用数据库查询选项")
@@ -1186,6 +2017,15 @@ def main():
     
     input_path = Path(args.input)
     
+    if args.batch_submit:
+        print(f"=== 提交批量任务: {input_path} ===")
+        if input_path.is_dir():
+            _, txt_files = analyzer._collect_txt_files(input_path, args.pattern, args.max_files)
+        else:
+            txt_files = [input_path]
+        analyzer.submit_batch(txt_files)
+        return
+    
     if input_path.is_file():
         # 分析单个文件
         print(f"分析文件: {input_path}")
@@ -1218,7 +2058,16 @@ def main():
     elif input_path.is_dir():
         # 批量分析目录
         print(f"分析目录: {input_path}")
-        results = analyzer.batch_analyze(input_path, args.pattern, args.max_files, args.force_reanalyze, args.batch_size, args.max_workers, args.skip_cached)
+        if args.use_async:
+            async def run_async():
+                try:
+                    return await analyzer.batch_analyze_async(input_path, args.pattern, args.max_files, args.force_reanalyze, args.max_workers, args.skip_cached)
+                finally:
+                    await analyzer.aclose()
+            
+            results = asyncio.run(run_async())
+        else:
+            results = analyzer.batch_analyze(input_path, args.pattern, args.max_files, args.force_reanalyze, args.batch_size, args.max_workers, args.skip_cached)
         
         # 保存结果
         analyzer.save_results(results, args.output)
@@ -3,92 +3,189 @@
 SAT题目展示Web应用
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, send_from_directory, send_file, stream_with_context
 import sqlite3
 import os
 import json
+import base64
+import logging
+import mimetypes
+import functools
+import hashlib
+import random
+import time
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import ssl
 import socket
+import threading
 from pathlib import Path
-from config import OPENROUTER_API_KEY, OPENROUTER_MODEL, OPENROUTER_BASE_URL, DB_PATH
+from urllib.parse import quote
+from config import OPENROUTER_API_KEY, OPENROUTER_MODEL, OPENROUTER_BASE_URL, DB_PATH, CACHE_TTL, IMAGE_DIR, IMAGE_ACCEL_REDIRECT
+from taxonomy import QUESTION_TYPES, QUESTION_CATEGORIES
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库json
+    orjson = None
+
+try:
+    from flask_compress import Compress
+except ImportError:  # 未安装flask-compress时不压缩响应
+    Compress = None
 
 app = Flask(__name__)
 
+# 压缩JSON和HTML响应（题目列表中每行的键都相同，压缩率很高）；SSE流不压缩，避免被缓冲
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_BR_LEVEL'] = 4
+# 流式返回的题目列表逐块压缩（gzip不支持流式压缩；需要Flask-Compress 1.22及以上）
+app.config['COMPRESS_ALGORITHM_STREAMING'] = ['br', 'deflate']
+if Compress is not None:
+    Compress(app)
+
+# 调试日志（请求参数、API响应状态）只在DEBUG级别输出
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 # 数据库路径
 DB_PATH = DB_PATH
 
+# 题目图片目录和占位符图片
+# 图片根目录在启动时解析为绝对路径，请求的图片必须位于其中
+IMAGE_DIR = Path(IMAGE_DIR).resolve()
+PLACEHOLDER_DIR = "/Volumes/ext/SatExams/src/www/static/images"
+# 占位符图片在运行期间不会变化，启动时检查一次
+HAS_PLACEHOLDER = os.path.exists(os.path.join(PLACEHOLDER_DIR, "placeholder.svg"))
+# 题目图片生成后不会修改，浏览器缓存一天，之后用Last-Modified/ETag验证（未修改时返回304）
+IMAGE_MAX_AGE = 86400
+# 图片查找结果（存在/不存在）的缓存时间（秒）
+IMAGE_LOOKUP_TTL = 60
+
 # 自定义过滤器：解析JSON字符串
 @app.template_filter('from_json')
 def from_json_filter(value):
-    """将JSON字符串转换为Python对象"""
+    """将JSON字符串转换为Python对象（相同的字符串只解析一次）"""
+    if not isinstance(value, (str, bytes)):
+        return value
+    return _parse_json(value)
+
+@functools.lru_cache(maxsize=65536)
+def _parse_json(value):
+    """解析JSON字符串，失败时原样返回；结果在模板间共享，只读使用"""
     try:
-        import json
-        return json.loads(value)
-    except:
+        return json_loads(value)
+    except ValueError:
         return value
 
-# SAT题型定义（新分类）
-QUESTION_TYPES = {
-    # Reading & Writing 题型
-    "text_structure_and_purpose": "Text Structure and Purpose",
-    "cross_text_connections": "Cross-Text Connections",
-    "words_in_context": "Words in Context",
-    "central_ideas_and_details": "Central Ideas and Details",
-    "command_of_evidence_quantitative": "Command of Evidence – Quantitative",
-    "command_of_evidence_textual": "Command of Evidence – Textual",
-    "inference": "Inference",
-    "boundaries": "Boundaries",
-    "form_structure_and_sense": "Form, Structure, and Sense",
-    "transitions": "Transitions",
-    "rhetorical_synthesis": "Rhetorical Synthesis",
-    
-    # Math 题型
-    "algebra": "Algebra",
-    "percents_and_ratios": "Percents and Ratios",
-    "advanced_math": "Advanced Math",
-    "powers_and_roots": "Powers and Roots",
-    "word_problems": "Word Problems",
-    "statistics": "Statistics",
-    "data_analysis": "Data Analysis",
-    "coordinate_plane": "Coordinate Plane",
-    "geometry": "Geometry",
-    "trigonometry": "Trigonometry",
-    
-    # 特殊题型
-    "title": "Title & Instructions"
-}
+# 每个线程复用一个只读数据库连接
+_tls = threading.local()
+# 写入（答案缓存）使用单独的一个连接，由锁保证同一时间只有一个线程写
+_writer = None
+_write_lock = threading.Lock()
 
-# 题型分类
-QUESTION_CATEGORIES = {
-    "reading_writing": {
-        "name": "Reading & Writing",
-        "types": [
-            "text_structure_and_purpose", "cross_text_connections", "words_in_context",
-            "central_ideas_and_details", "command_of_evidence_quantitative", "command_of_evidence_textual",
-            "inference", "boundaries", "form_structure_and_sense", "transitions", "rhetorical_synthesis"
-        ]
-    },
-    "math": {
-        "name": "Math",
-        "types": [
-            "algebra", "percents_and_ratios", "advanced_math", "powers_and_roots",
-            "word_problems", "statistics", "data_analysis", "coordinate_plane", "geometry", "trigonometry"
-        ]
-    },
-    "special": {
-        "name": "Special",
-        "types": ["title"]
-    }
-}
+def _init_db():
+    """启用WAL模式并建立题目查询用的索引（均保存在数据库中，启动时执行一次即可）"""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        # 读请求不会被写入阻塞
+        conn.execute('PRAGMA journal_mode=WAL')
+        # 是否有选项作为生成列（VIRTUAL，不改变已有数据），查询时直接比较索引中的值，不再逐行计算LENGTH
+        columns = {row[1] for row in conn.execute('PRAGMA table_xinfo(questions)')}
+        if 'has_options' not in columns:
+            conn.execute('ALTER TABLE questions ADD COLUMN has_options INTEGER '
+                         'GENERATED ALWAYS AS (options IS NOT NULL AND LENGTH(options) >= 10) VIRTUAL')
+        # 题目图片路径（.txt换成.png）同样作为生成列，由SQLite在读取时计算
+        if 'png_path' not in columns:
+            conn.execute("ALTER TABLE questions ADD COLUMN png_path TEXT GENERATED ALWAYS AS ("
+                         "CASE WHEN substr(file_path, -4) = '.txt' THEN substr(file_path, 1, length(file_path) - 4) || '.png' "
+                         "ELSE replace(file_path, '.txt', '.png') END) VIRTUAL")
+        # 列表查询都带has_options = 1条件，只用下面含has_options的索引；旧索引只会增加写入开销
+        conn.execute('DROP INDEX IF EXISTS idx_q_type_opts')
+        conn.execute('DROP INDEX IF EXISTS idx_q_type_time')
+        # 按题型过滤、按添加时间倒序，ORDER BY 直接走索引，OFFSET 只跳过索引项
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_qt_has ON questions(question_type, has_options, add_time DESC)')
+        # 同时按题型和考试过滤时，等值条件都落在索引前缀上，按时间顺序读取不需要排序
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_qt_exam_time ON questions(question_type, exam_name, has_options, add_time DESC)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_q_exam_time ON questions(exam_name, has_options, add_time DESC)')
+        # AI检查答案的结果缓存，相同的题目、选项和答案不再请求AI
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                hash TEXT PRIMARY KEY,
+                analysis TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+
+_init_db()
 
 def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """获取当前线程的只读数据库连接（首次使用时创建，之后每个请求复用）"""
+    conn = getattr(_tls, 'conn', None)
+    if conn is None:
+        # 自动提交模式：只读查询不会隐式开启事务
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # query_only：连接上的写语句直接报错；数据库文件映射到内存，热点页面不需要read系统调用
+        conn.executescript("""
+            PRAGMA query_only=ON;
+            PRAGMA cache_size=-131072;
+            PRAGMA mmap_size=1073741824;
+            PRAGMA temp_store=MEMORY;
+        """)
+        _tls.conn = conn
     return conn
 
+def write_db(sql, params=()):
+    """在写连接上执行一条写语句（首次使用时创建连接）"""
+    global _writer
+    with _write_lock:
+        if _writer is None:
+            _writer = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+            _writer.execute('PRAGMA synchronous=NORMAL')
+        _writer.execute(sql, params)
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """请求结束时不关闭连接，只回滚未结束的事务，避免把锁带到下一个请求"""
+    conn = getattr(_tls, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+def ttl_cache(ttl=CACHE_TTL, maxsize=128):
+    """按位置参数缓存函数结果ttl秒；题库由批量分析脚本写入，不随请求变化"""
+    def decorator(func):
+        cache = {}
+        lock = threading.Lock()
+        
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                entry = cache.get(args)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            
+            value = func(*args)
+            with lock:
+                if args not in cache and len(cache) >= maxsize:
+                    # 淘汰最早写入的结果
+                    cache.pop(next(iter(cache)))
+                cache[args] = (now + ttl, value)
+            return value
+        
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+@ttl_cache(maxsize=1)
 def get_question_types():
     """获取所有题型及其数量"""
     conn = get_db_connection()
@@ -102,11 +199,11 @@ def get_question_types():
     """)
     
     results = cursor.fetchall()
-    conn.close()
     
-    # 将Row对象转换为字典
-    return [dict(row) for row in results]
+    # 将Row对象转换为字典；结果被缓存并在请求间共享，返回元组防止被修改
+    return tuple(dict(row) for row in results)
 
+@ttl_cache(maxsize=1)
 def get_exam_names():
     """获取所有考试名称及其数量"""
     conn = get_db_connection()
@@ -121,57 +218,159 @@ def get_exam_names():
     """)
     
     results = cursor.fetchall()
-    conn.close()
     
-    # 将Row对象转换为字典
-    return [dict(row) for row in results]
+    # 将Row对象转换为字典；结果被缓存并在请求间共享，返回元组防止被修改
+    return tuple(dict(row) for row in results)
 
-def get_questions_by_type(question_type, limit=100, order='random', start_question=1, exam_name=None):
-    """根据题型获取题目"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 构建WHERE条件
+def get_questions_by_type(question_type, limit=100, order='random', start_question=1, exam_name=None, after=None):
+    """
+    根据题型获取题目（随机顺序从缓存的id列表中抽样，其余顺序的结果会被缓存）。
+    按时间排序时可传入after=(add_time, id)，从该题之后继续读取，代替按start_question跳过
+    """
+    if order == 'random':
+        return _sample_questions(question_type, limit, exam_name)
+    if after is not None:
+        return _query_questions_after_cached(question_type, limit, after[0], after[1], exam_name)
+    return _query_questions_cached(question_type, limit, start_question, exam_name)
+
+def encode_cursor(row):
+    """把一页最后一题的(add_time, id)编码为翻页游标"""
+    data = json.dumps([row['add_time'], row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(value):
+    """解析翻页游标，无效时返回None"""
+    if not value:
+        return None
+    try:
+        add_time, question_id = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(add_time, str) or not isinstance(question_id, int):
+        return None
+    return add_time, question_id
+
+def next_cursor(questions, order, limit):
+    """按时间排序且本页已满时返回下一页的游标"""
+    if order == 'random' or not questions or len(questions) < limit:
+        return None
+    return encode_cursor(questions[-1])
+
+QUESTION_COLUMNS = "id, file_path, question_id, question_type, content, options, confidence, add_time, exam_name, png_path"
+# 查询结果的列名，按位置对应每行的值
+QUESTION_FIELDS = tuple(QUESTION_COLUMNS.split(', '))
+
+def _where_clause(by_type, by_exam):
+    """生成题目过滤条件"""
     where_conditions = [
-        "(options IS NOT NULL AND LENGTH(options) >= 10)"
+        "has_options = 1"
     ]
+    if by_type:
+        where_conditions.append("question_type = ?")
+    if by_exam:
+        where_conditions.append("exam_name = ?")
+    return " AND ".join(where_conditions)
+
+def _filter_params(question_type, exam_name):
+    """返回(按题型过滤, 按考试过滤, 过滤参数)"""
+    by_type = bool(question_type and question_type != "全部")
+    by_exam = bool(exam_name and exam_name != "全部")
     params = []
-    
     # 如果指定了题型，添加过滤条件
-    if question_type and question_type != "全部":
-        where_conditions.append("question_type = ?")
+    if by_type:
         params.append(question_type)
-    
     # 如果指定了考试名称，添加过滤条件
-    if exam_name and exam_name != "全部":
-        where_conditions.append("exam_name = ?")
+    if by_exam:
         params.append(exam_name)
-    
-    where_clause = " AND ".join(where_conditions)
-    
-    if order == 'random':
-        # 随机排序
-        cursor.execute(f"""
-            SELECT id, file_path, question_id, question_type, content, options, confidence, add_time, exam_name
+    return by_type, by_exam, params
+
+# 所有题目查询语句在启动时生成，按(按题型过滤, 按考试过滤)查表；
+# 每次执行相同的语句文本，命中连接的预编译语句缓存
+FILTERS = [(by_type, by_exam) for by_type in (False, True) for by_exam in (False, True)]
+
+# 按时间排序，支持起始位置（同一时间添加的题目按id排序，保证翻页顺序稳定）
+QUESTION_SQL = {
+    key: f"""
+            SELECT {QUESTION_COLUMNS}
+            FROM questions 
+            WHERE {_where_clause(*key)}
+            ORDER BY add_time DESC, id
+            LIMIT ? OFFSET ?
+        """
+    for key in FILTERS
+}
+
+# 按时间排序，从上一页最后一题之后继续读取；不需要扫描并丢弃前面的行
+QUESTION_AFTER_SQL = {
+    key: f"""
+            SELECT {QUESTION_COLUMNS}
             FROM questions 
-            WHERE {where_clause}
-            ORDER BY RANDOM()
+            WHERE {_where_clause(*key)}
+              AND add_time <= ? AND (add_time < ? OR id > ?)
+            ORDER BY add_time DESC, id
             LIMIT ?
-        """, params + [limit])
-    else:
-        # 按时间排序，支持起始位置
-        cursor.execute(f"""
-            SELECT id, file_path, question_id, question_type, content, options, confidence, add_time, exam_name
+        """
+    for key in FILTERS
+}
+
+# 随机抽样用的候选id
+QUESTION_ID_SQL = {
+    key: f"SELECT id FROM questions WHERE {_where_clause(*key)}"
+    for key in FILTERS
+}
+
+# 按抽中的id取回整行，id列表以JSON数组传入，语句文本不随数量变化
+QUESTIONS_BY_ID_SQL = f"""
+            SELECT {QUESTION_COLUMNS}
             FROM questions 
-            WHERE {where_clause}
-            ORDER BY add_time DESC
-            LIMIT ? OFFSET ?
-        """, params + [limit, start_question - 1])
+            WHERE id IN (SELECT value FROM json_each(?))
+        """
+
+def _query_questions(question_type, limit, start_question, exam_name):
+    """按添加时间倒序查询题目"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
-    results = cursor.fetchall()
-    conn.close()
+    by_type, by_exam, params = _filter_params(question_type, exam_name)
+    params += [limit, start_question - 1]
+    
+    cursor.execute(QUESTION_SQL[by_type, by_exam], params)
+    # 结果被缓存并在请求间共享，返回元组防止被修改
+    return tuple(cursor.fetchall())
+
+_query_questions_cached = ttl_cache()(_query_questions)
+
+def _query_questions_after(question_type, limit, add_time, question_id, exam_name):
+    """按添加时间倒序查询(add_time, question_id)之后的题目"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    by_type, by_exam, params = _filter_params(question_type, exam_name)
+    params += [add_time, add_time, question_id, limit]
     
-    return results
+    cursor.execute(QUESTION_AFTER_SQL[by_type, by_exam], params)
+    # 结果被缓存并在请求间共享，返回元组防止被修改
+    return tuple(cursor.fetchall())
+
+_query_questions_after_cached = ttl_cache()(_query_questions_after)
+
+@ttl_cache()
+def _question_ids(question_type, exam_name):
+    """符合条件的所有题目id（只读索引，结果缓存CACHE_TTL秒）"""
+    by_type, by_exam, params = _filter_params(question_type, exam_name)
+    cursor = get_db_connection().execute(QUESTION_ID_SQL[by_type, by_exam], params)
+    return tuple(row[0] for row in cursor)
+
+def _sample_questions(question_type, limit, exam_name):
+    """随机抽取题目：在缓存的id列表中抽样，再按id逐个取回，不需要对所有符合条件的行随机排序"""
+    ids = _question_ids(question_type, exam_name)
+    # 与SQL的LIMIT一致：负数表示不限制数量
+    count = len(ids) if limit < 0 else min(limit, len(ids))
+    sample = random.sample(ids, count)
+    cursor = get_db_connection().execute(QUESTIONS_BY_ID_SQL, (json.dumps(sample),))
+    rows = {row['id']: row for row in cursor}
+    # 保持抽样顺序
+    return [rows[question_id] for question_id in sample if question_id in rows]
 
 @app.route('/')
 def index():
@@ -193,12 +392,16 @@ def questions():
     order = request.args.get('order', 'random')
     start_question = int(request.args.get('start_question', 1))
     exam_name = request.args.get('exam_name', '全部')
+    cursor = request.args.get('cursor', '')
     
     # 如果是随机模式，忽略起始题目参数
     if order == 'random':
         start_question = 1
+        cursor = ''
     
-    questions = get_questions_by_type(question_type, limit, order, start_question, exam_name)
+    # 有游标时从游标处继续读取，start_question只用于显示
+    questions = get_questions_by_type(question_type, limit, order, start_question, exam_name, decode_cursor(cursor))
+    next_page = next_cursor(questions, order, limit)
     
     # 确定题型描述
     if question_type and question_type != "全部":
@@ -215,7 +418,10 @@ def questions():
                              total_count=len(questions),
                              order=order,
                              start_question=start_question,
-                             exam_name=exam_name)
+                             exam_name=exam_name,
+                             limit=limit,
+                             cursor=cursor,
+                             next_cursor=next_page)
     else:
         return render_template('questions.html', 
                              questions=questions, 
@@ -225,17 +431,56 @@ def questions():
                              total_count=len(questions),
                              order=order,
                              start_question=start_question,
-                             exam_name=exam_name)
+                             exam_name=exam_name,
+                             limit=limit,
+                             cursor=cursor,
+                             next_cursor=next_page)
+
+def json_dumps(data):
+    """序列化为UTF-8编码的JSON字节；安装了orjson时使用其C实现"""
+    if orjson is None:
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+def json_loads(data):
+    """解析JSON字节；安装了orjson时使用其C实现"""
+    if orjson is None:
+        return json.loads(data)
+    return orjson.loads(data)
+
+def json_response(data):
+    """返回JSON响应（代替jsonify，中文不转义为\\uXXXX）"""
+    return app.response_class(json_dumps(data), mimetype='application/json')
+
+def json_array_response(items):
+    """逐项序列化JSON数组并流式返回，不在内存中拼出完整的响应体"""
+    def generate():
+        yield b'['
+        for i, item in enumerate(items):
+            yield (b',' if i else b'') + json_dumps(item)
+        yield b']'
+    
+    return app.response_class(generate(), mimetype='application/json')
 
 @app.route('/api/question_types')
 def api_question_types():
     """API: 获取题型列表"""
     question_types = get_question_types()
-    return jsonify([{
+    response = json_response([{
         'type': row['question_type'],
         'count': row['count'],
         'description': QUESTION_TYPES.get(row['question_type'], row['question_type'])
     } for row in question_types])
+    # 按内容生成ETag，题型统计未变化时返回304；统计结果本身缓存CACHE_TTL秒
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=8).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = CACHE_TTL
+    return response.make_conditional(request)
+
+def _question_items(rows):
+    """逐行生成API返回的题目对象：按列位置取值，不经过sqlite3.Row的列名查找"""
+    for row in rows:
+        yield dict(zip(QUESTION_FIELDS, row))
 
 @app.route('/api/questions')
 def api_questions():
@@ -245,115 +490,205 @@ def api_questions():
     order = request.args.get('order', 'random')
     start_question = int(request.args.get('start_question', 1))
     exam_name = request.args.get('exam_name', '全部')
+    cursor = decode_cursor(request.args.get('cursor', ''))
     
     # 如果是随机模式，忽略起始题目参数
     if order == 'random':
         start_question = 1
+        cursor = None
     
-    questions = get_questions_by_type(question_type, limit, order, start_question, exam_name)
+    questions = get_questions_by_type(question_type, limit, order, start_question, exam_name, cursor)
     
-    return jsonify([{
-        'id': row['id'],
-        'file_path': row['file_path'],
-        'question_id': row['question_id'],
-        'question_type': row['question_type'],
-        'content': row['content'],
-        'options': row['options'],
-        'confidence': row['confidence'],
-        'add_time': row['add_time'],
-        'exam_name': row['exam_name'],
-        'png_path': row['file_path'].replace('.txt', '.png')
-    } for row in questions])
+    response = json_array_response(_question_items(questions))
+    # 下一页游标放在响应头中，响应体仍是题目列表
+    next_page = next_cursor(questions, order, limit)
+    if next_page:
+        response.headers['X-Next-Cursor'] = next_page
+    return response
+
+@functools.lru_cache(maxsize=8192)
+def _image_lookup(filename, period):
+    """
+    查找图片，返回已存在的图片路径，不存在时返回None，指向图片目录之外时返回False。
+    结果按(文件名, 时间段)缓存，同一时间段内重复访问同一图片不再检查文件系统
+    """
+    try:
+        image_path = (IMAGE_DIR / filename).resolve()
+        if not image_path.is_relative_to(IMAGE_DIR):
+            return False
+        if not image_path.is_file():
+            return None
+    except (ValueError, OSError):
+        # 文件名包含NUL等非法字符，或路径无法访问
+        return False
+    return image_path
+
+def resolve_image(filename):
+    """
+    返回已存在的图片路径；查找结果缓存IMAGE_LOOKUP_TTL秒，之后新生成或删除的图片可以被发现。
+    图片不存在时抛出FileNotFoundError；路径（如包含..）指向图片目录之外时抛出PermissionError
+    """
+    image_path = _image_lookup(filename, int(time.monotonic() // IMAGE_LOOKUP_TTL))
+    if image_path is False:
+        raise PermissionError(filename)
+    if image_path is None:
+        raise FileNotFoundError(filename)
+    return image_path
+
+def _image_not_found():
+    """图片不存在时返回占位符图片，没有占位符图片时返回404"""
+    if HAS_PLACEHOLDER:
+        return send_from_directory(PLACEHOLDER_DIR, "placeholder.svg")
+    return "图片不存在", 404
 
 @app.route('/static/images/<path:filename>')
 def serve_image(filename):
     """提供图片文件服务"""
-    # 构建完整的图片路径
-    image_path = f"/Volumes/ext/SatExams/data/output/{filename}"
+    try:
+        image_path = resolve_image(filename)
+    except PermissionError:
+        # 不允许访问图片目录之外的文件
+        return "图片不存在", 404
+    except FileNotFoundError:
+        return _image_not_found()
+    
+    if IMAGE_ACCEL_REDIRECT:
+        # 由nginx读取并发送文件，工作线程不再逐块传输图片
+        # nginx沿用这里的Content-Type，按扩展名设置图片类型（默认是text/html）
+        mimetype = mimetypes.guess_type(image_path.name)[0] or 'image/png'
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = IMAGE_ACCEL_REDIRECT + quote(image_path.relative_to(IMAGE_DIR).as_posix())
+        response.cache_control.public = True
+        response.cache_control.max_age = IMAGE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
     
-    if os.path.exists(image_path):
-        # 如果图片存在，返回图片
-        return send_from_directory(os.path.dirname(image_path), os.path.basename(image_path))
+    # 如果图片存在，返回图片（支持条件请求，ETag由文件修改时间和大小生成）；
+    # 图片生成后不会修改，标记为immutable，有效期内浏览器刷新页面也不再验证
+    try:
+        response = send_file(image_path, conditional=True, max_age=IMAGE_MAX_AGE)
+    except FileNotFoundError:
+        # 缓存的查找结果过期前图片已被删除
+        return _image_not_found()
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def _make_http_session():
+    """创建复用连接的OpenRouter会话：保持TCP/TLS连接，429和网关错误时退避重试"""
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504],
+                  allowed_methods=frozenset(['POST']), raise_on_status=False)
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+_http_session = _make_http_session()
+
+# 检查答案提示词的版本，修改_post_answer_check中的提示词时递增，使旧的缓存结果失效
+ANSWER_PROMPT_VERSION = 1
+
+def _answer_hash(question_content, options, user_answer):
+    """
+    题目、选项和用户答案的内容哈希，作为答案缓存的键（选项按键排序，顺序不影响结果）。
+    模型和提示词版本也计入哈希，更换模型或修改提示词后不再返回旧的结果
+    """
+    key = [OPENROUTER_MODEL, ANSWER_PROMPT_VERSION, question_content, options, user_answer]
+    if orjson is None:
+        data = json.dumps(key, ensure_ascii=False, sort_keys=True).encode('utf-8')
     else:
-        # 如果图片不存在，返回占位符图片
-        placeholder_path = "/Volumes/ext/SatExams/src/www/static/images/placeholder.svg"
-        if os.path.exists(placeholder_path):
-            return send_from_directory("/Volumes/ext/SatExams/src/www/static/images", "placeholder.svg")
-        else:
-            # 如果没有占位符图片，返回404
-            return "图片不存在", 404
+        data = orjson.dumps(key, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _get_cached_answer(key):
+    """查询缓存的AI分析，未命中时返回None"""
+    row = get_db_connection().execute("SELECT analysis FROM answer_cache WHERE hash = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _cache_answer(key, analysis):
+    """保存AI分析结果"""
+    write_db("INSERT OR IGNORE INTO answer_cache (hash, analysis) VALUES (?, ?)", (key, analysis))
+
+def _post_answer_check(question_content, options, user_answer, stream=False):
+    """向OpenRouter发送检查答案的请求；stream为True时以SSE流式返回生成的内容"""
+    # 格式化选项
+    if isinstance(options, dict):
+        options_text = "\n".join([f"{key}. {value}" for key, value in options.items()])
+    else:
+        options_text = str(options)
+    
+    # 构建简化的提示词，避免编码问题
+    prompt = f"Analyze this SAT question and check if the answer is correct.\n\nQuestion: {question_content}\n\nOptions:\n{options_text}\n\nUser's answer: {user_answer}\n\nPlease provide:\n1. Correct answer: [A/B/C/D]\n2. Is user's answer correct: [Yes/No]\n3. Solution steps: [detailed explanation]\n4. Key concepts: [main knowledge points]\n5. Suggestions: [improvement advice]"
+
+    # 调用OpenRouter API
+    headers = {
+        'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+        'Content-Type': 'application/json',
+        'HTTP-Referer': 'https://localhost:8080',
+        'X-Title': 'SAT Answer Check'
+    }
+    
+    data = {
+        'model': OPENROUTER_MODEL,
+        'messages': [
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ],
+        'temperature': 0.3,
+        'max_tokens': 1000
+    }
+    if stream:
+        data['stream'] = True
+    
+    # 使用共享会话发送请求（请求体预先序列化为UTF-8字节，Content-Type已在headers中指定）
+    response = _http_session.post(
+        f'{OPENROUTER_BASE_URL}/chat/completions',
+        headers=headers,
+        data=json_dumps(data),
+        timeout=30,
+        stream=stream
+    )
+    
+    logger.debug("API响应状态: %s", response.status_code)
+    return response
 
 def check_answer_with_ai(question_content, options, user_answer):
-    """使用AI检查答案"""
+    """使用AI检查答案（正常生成结束的结果按内容哈希缓存）"""
     try:
-        print(f"开始AI检查，参数类型: question_content={type(question_content)}, options={type(options)}, user_answer={type(user_answer)}")
-        print(f"question_content长度: {len(str(question_content))}")
-        print(f"options内容: {options}")
-        print(f"user_answer: {user_answer}")
-        # 格式化选项
-        if isinstance(options, dict):
-            options_text = "\n".join([f"{key}. {value}" for key, value in options.items()])
-        else:
-            options_text = str(options)
-        
-        # 构建简化的提示词，避免编码问题
-        prompt = f"Analyze this SAT question and check if the answer is correct.\n\nQuestion: {question_content}\n\nOptions:\n{options_text}\n\nUser's answer: {user_answer}\n\nPlease provide:\n1. Correct answer: [A/B/C/D]\n2. Is user's answer correct: [Yes/No]\n3. Solution steps: [detailed explanation]\n4. Key concepts: [main knowledge points]\n5. Suggestions: [improvement advice]"
-
-        # 调用OpenRouter API
-        headers = {
-            'Authorization': f'Bearer {OPENROUTER_API_KEY}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'https://localhost:8080',
-            'X-Title': 'SAT Answer Check'
-        }
-        
-        data = {
-            'model': OPENROUTER_MODEL,
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            'temperature': 0.3,
-            'max_tokens': 1000
-        }
-        
-        # 使用json.dumps确保正确的编码
-        import json
-        json_data = json.dumps(data, ensure_ascii=False)
-        
-        # 使用requests发送请求
-        response = requests.post(
-            f'{OPENROUTER_BASE_URL}/chat/completions',
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+        logger.debug("开始AI检查，参数类型: question_content=%s, options=%s, user_answer=%r",
+                     type(question_content).__name__, type(options).__name__, user_answer)
+        cache_key = _answer_hash(question_content, options, user_answer)
+        cached = _get_cached_answer(cache_key)
+        if cached is not None:
+            logger.debug("命中答案缓存: %s", cache_key)
+            return {
+                'success': True,
+                'analysis': cached
+            }
         
-        print(f"API响应状态: {response.status_code}")
-        print(f"API响应内容: {response.text[:200]}...")  # 只打印前200个字符
+        response = _post_answer_check(question_content, options, user_answer)
         
         if response.status_code == 200:
-            response_data = response.json()
+            response_data = json_loads(response.content)
         else:
             return {
                 'success': False,
                 'error': f'API调用失败: {response.status_code} - {response.text[:100]}'
             }
         
-        ai_response = response_data['choices'][0]['message']['content']
+        choice = response_data['choices'][0]
+        ai_response = choice['message']['content']
+        # 只缓存正常结束的结果；因max_tokens截断（finish_reason为length）的不缓存
+        if choice.get('finish_reason') == 'stop':
+            _cache_answer(cache_key, ai_response)
         return {
             'success': True,
             'analysis': ai_response
         }
             
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"AI检查错误详情: {error_trace}")
-        print(f"错误类型: {type(e)}")
-        print(f"错误信息: {str(e)}")
+        logger.exception("AI检查错误")
         return {
             'success': False,
             'error': f'检查答案时出错: {str(e)}'
@@ -363,39 +698,122 @@ def check_answer_with_ai(question_content, options, user_answer):
 def api_check_answer():
     """API: 检查答案"""
     try:
-        data = request.get_json()
+        data = json_loads(request.get_data())
+    except ValueError as e:
+        # orjson.JSONDecodeError和json.JSONDecodeError都是ValueError的子类
+        return json_response({'error': f'服务器错误: {str(e)}'}), 400
+    if not isinstance(data, dict):
+        return json_response({'error': '缺少必要参数'}), 400
+    try:
         question_content = data.get('question_content')
         options = data.get('options')
         user_answer = data.get('user_answer')
         
-        print(f"收到请求: question_content长度={len(str(question_content))}, options类型={type(options)}, user_answer={user_answer}")
+        logger.debug("收到请求: options类型=%s, user_answer=%r", type(options).__name__, user_answer)
         
         if not all([question_content, options, user_answer]):
-            return jsonify({'error': '缺少必要参数'}), 400
-        
-        # 确保字符串是UTF-8编码
-        if isinstance(question_content, str):
-            question_content = question_content.encode('utf-8').decode('utf-8')
-        if isinstance(user_answer, str):
-            user_answer = user_answer.encode('utf-8').decode('utf-8')
-        
-        # 处理选项字典
-        if isinstance(options, dict):
-            for key, value in options.items():
-                if isinstance(value, str):
-                    options[key] = value.encode('utf-8').decode('utf-8')
+            return json_response({'error': '缺少必要参数'}), 400
         
-        print(f"开始AI分析...")
+        logger.debug("开始AI分析...")
         result = check_answer_with_ai(question_content, options, user_answer)
-        print(f"AI分析完成: success={result.get('success')}")
+        logger.debug("AI分析完成: success=%s", result.get('success'))
         
-        response = jsonify(result)
+        response = json_response(result)
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response
         
     except Exception as e:
-        print(f"API错误: {str(e)}")
-        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+        logger.exception("API错误")
+        return json_response({'error': f'服务器错误: {str(e)}'}), 500
+
+def _sse(data, event=None):
+    """格式化一条Server-Sent Events消息"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json_dumps(data).decode('utf-8')}\n\n"
+
+def _stream_answer_check(question_content, options, user_answer):
+    """
+    流式检查答案：逐段转发AI生成的内容（data: {"delta": ...}），
+    结束时发送 event: done，出错或生成未完成时发送 event: error；只有完整的结果写入答案缓存。
+    流式返回只是让用户更早看到输出，整个请求期间仍占用一个工作线程
+    """
+    try:
+        cache_key = _answer_hash(question_content, options, user_answer)
+        cached = _get_cached_answer(cache_key)
+        if cached is not None:
+            yield _sse({'delta': cached})
+            yield _sse({}, event='done')
+            return
+        
+        with _post_answer_check(question_content, options, user_answer, stream=True) as response:
+            if response.status_code != 200:
+                yield _sse({'error': f'API调用失败: {response.status_code} - {response.text[:100]}'}, event='error')
+                return
+            
+            parts = []
+            finished = False
+            finish_reason = None
+            for line in response.iter_lines():
+                # OpenRouter的SSE流中以冒号开头的是保活注释
+                if not line.startswith(b'data: '):
+                    continue
+                payload = line[len(b'data: '):]
+                if payload == b'[DONE]':
+                    finished = True
+                    break
+                chunk = json_loads(payload)
+                choice = (chunk.get('choices') or [{}])[0]
+                # 生成过程中出错时，OpenRouter在流中发送error字段（finish_reason为error）
+                if chunk.get('error') or choice.get('finish_reason') == 'error':
+                    error = chunk.get('error') or {}
+                    message = error.get('message', error) if isinstance(error, dict) else error
+                    yield _sse({'error': f'AI生成出错: {message}'}, event='error')
+                    return
+                delta = (choice.get('delta') or {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield _sse({'delta': delta})
+                if choice.get('finish_reason'):
+                    finish_reason = choice['finish_reason']
+                    if finish_reason == 'stop':
+                        finished = True
+        
+        # 没有收到结束标记说明上游连接中途断开，不缓存不完整的结果
+        if not finished:
+            yield _sse({'error': '连接中断，AI分析未完成'}, event='error')
+            return
+        # 只缓存正常结束的结果；因max_tokens截断（finish_reason为length）的不缓存
+        if parts and finish_reason == 'stop':
+            _cache_answer(cache_key, ''.join(parts))
+        yield _sse({}, event='done')
+    except Exception as e:
+        logger.exception("AI流式检查错误")
+        yield _sse({'error': f'检查答案时出错: {str(e)}'}, event='error')
+
+@app.route('/api/check_answer/stream', methods=['POST'])
+def api_check_answer_stream():
+    """API: 检查答案，以Server-Sent Events流式返回AI分析"""
+    try:
+        data = json_loads(request.get_data())
+    except ValueError as e:
+        return json_response({'error': f'服务器错误: {str(e)}'}), 400
+    if not isinstance(data, dict):
+        return json_response({'error': '缺少必要参数'}), 400
+    question_content = data.get('question_content')
+    options = data.get('options')
+    user_answer = data.get('user_answer')
+    
+    if not all([question_content, options, user_answer]):
+        return json_response({'error': '缺少必要参数'}), 400
+    
+    response = app.response_class(stream_with_context(_stream_answer_check(question_content, options, user_answer)),
+                                  mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭nginx的响应缓冲，内容生成后立即发送给浏览器
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 if __name__ == '__main__':
+    # 开发服务器以调试模式运行，输出调试日志
+    logger.setLevel(logging.DEBUG)
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -13,6 +13,16 @@ OPENROUTER_BASE_URL = 'https://openrouter.ai/api/v1'
 # 数据库配置
 DB_PATH = "/Volumes/ext/SatExams/data/types.db"
 
+# 题型列表、考试列表和非随机题目查询结果的缓存时间（秒）
+CACHE_TTL = 60
+
+# 题目图片目录
+IMAGE_DIR = "/Volumes/ext/SatExams/data/output"
+
+# 题目图片交给前端nginx发送：设置为nginx中internal location的URL前缀（如 '/protected_images/'，
+# alias指向 /Volumes/ext/SatExams/data/output/），为None时由Flask直接发送文件
+IMAGE_ACCEL_REDIRECT = None
+
 # 应用配置
 DEBUG = True
 HOST = '0.0.0.0'
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+SAT题型及分类定义
+"""
+
+# SAT题型定义（新分类）
+QUESTION_TYPES = {
+    # Reading & Writing 题型
+    "text_structure_and_purpose": "Text Structure and Purpose",
+    "cross_text_connections": "Cross-Text Connections",
+    "words_in_context": "Words in Context",
+    "central_ideas_and_details": "Central Ideas and Details",
+    "command_of_evidence_quantitative": "Command of Evidence – Quantitative",
+    "command_of_evidence_textual": "Command of Evidence – Textual",
+    "inference": "Inference",
+    "boundaries": "Boundaries",
+    "form_structure_and_sense": "Form, Structure, and Sense",
+    "transitions": "Transitions",
+    "rhetorical_synthesis": "Rhetorical Synthesis",
+    
+    # Math 题型
+    "algebra": "Algebra",
+    "percents_and_ratios": "Percents and Ratios",
+    "advanced_math": "Advanced Math",
+    "powers_and_roots": "Powers and Roots",
+    "word_problems": "Word Problems",
+    "statistics": "Statistics",
+    "data_analysis": "Data Analysis",
+    "coordinate_plane": "Coordinate Plane",
+    "geometry": "Geometry",
+    "trigonometry": "Trigonometry",
+    
+    # 特殊题型
+    "title": "Title & Instructions"
+}
+
+# 题型分类
+QUESTION_CATEGORIES = {
+    "reading_writing": {
+        "name": "Reading & Writing",
+        "types": [
+            "text_structure_and_purpose", "cross_text_connections", "words_in_context",
+            "central_ideas_and_details", "command_of_evidence_quantitative", "command_of_evidence_textual",
+            "inference", "boundaries", "form_structure_and_sense", "transitions", "rhetorical_synthesis"
+        ]
+    },
+    "math": {
+        "name": "Math",
+        "types": [
+            "algebra", "percents_and_ratios", "advanced_math", "powers_and_roots",
+            "word_problems", "statistics", "data_analysis", "coordinate_plane", "geometry", "trigonometry"
+        ]
+    },
+    "special": {
+        "name": "Special",
+        "types": ["title"]
+    }
+}